@@ -0,0 +1,101 @@
+"""页面增强基准：比较原来的 PIL ImageEnhance.Sharpness 与 NumPy 内核的速度（串行和线程池），可选比较OCR准确率。
+
+    python benchmarks/enhance.py --pages 16 --workers 4
+    python benchmarks/enhance.py --pages 4 --ocr     # 需要安装 paddleocr
+
+页面是合成的300 DPI文字页，并加入模糊和噪声模拟扫描件；OCR准确率按识别文本与原文的字符相似度计算。
+"""
+import os
+import sys
+import time
+import random
+import difflib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pdfToDoc
+
+WORDS = ("gradient descent converges when the learning rate is small enough "
+         "the loss surface of a neural network is not convex in general "
+         "regularization reduces variance at the cost of additional bias").split()
+
+def synthetic_page(seed, dpi=300):
+    """生成一页A4大小、带模糊和噪声的文字图像，返回 (图像, 原文)"""
+    import numpy as np
+    from PIL import Image, ImageDraw, ImageFilter, ImageFont
+    rng = random.Random(seed)
+    width, height = int(8.27 * dpi), int(11.69 * dpi)
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    try:
+        font = ImageFont.load_default(size=dpi // 7)
+    except TypeError:
+        font = ImageFont.load_default()
+    lines = []
+    y = dpi // 2
+    while y < height - dpi:
+        line = " ".join(rng.choice(WORDS) for _ in range(8))
+        draw.text((dpi // 2, y), line, fill=(20, 20, 20), font=font)
+        lines.append(line)
+        y += dpi // 4
+    image = image.filter(ImageFilter.GaussianBlur(1.2))
+    noise = np.random.default_rng(seed).normal(0, 12, (height, width, 1))
+    pixels = np.clip(np.asarray(image, dtype=np.float32) + noise, 0, 255).astype(np.uint8)
+    return Image.fromarray(pixels), "\n".join(lines)
+
+def pil_enhance(image, enhance_level=1.5):
+    from PIL import ImageEnhance
+    return ImageEnhance.Sharpness(image).enhance(enhance_level)
+
+def threaded(func, images, workers):
+    """与流水线的增强阶段一样，用多个线程各自处理一页"""
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return list(executor.map(func, images))
+
+def timed(label, func, pages, count):
+    start = time.perf_counter()
+    results = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed:8.2f} s  {count / elapsed:8.2f} 页/秒")
+    return results
+
+def ocr_accuracy(engine, images, texts):
+    scores = []
+    for image, text in zip(images, texts):
+        lines = pdfToDoc.parse_ocr_result(engine.ocr(pdfToDoc.ocr_input(image), cls=False))
+        recognized = "\n".join(line["text"] for line in lines)
+        scores.append(difflib.SequenceMatcher(None, recognized, text).ratio())
+    return sum(scores) / len(scores)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--binarize", action="store_true", help="NumPy内核同时做二值化")
+    parser.add_argument("--ocr", action="store_true", help="同时比较OCR准确率（需要paddleocr）")
+    args = parser.parse_args(argv)
+
+    pdfToDoc.set_config({})
+    options = {"binarize": args.binarize}
+    pages = [synthetic_page(seed) for seed in range(args.pages)]
+    images = [image for image, _ in pages]
+    texts = [text for _, text in pages]
+    print(f"{args.pages} 页，{images[0].size[0]}x{images[0].size[1]} 像素，{args.workers} 个线程")
+
+    enhance = lambda image: pdfToDoc.enhance_image(image, options)
+    pil_results = timed("PIL Sharpness（串行）", lambda: [pil_enhance(image) for image in images], pages, args.pages)
+    timed("PIL Sharpness（线程池）", lambda: threaded(pil_enhance, images, args.workers), pages, args.pages)
+    numpy_results = timed("NumPy 内核（串行）", lambda: [enhance(image) for image in images], pages, args.pages)
+    timed("NumPy 内核（线程池）", lambda: threaded(enhance, images, args.workers), pages, args.pages)
+
+    if args.ocr:
+        engine = pdfToDoc.create_ocr_engine()
+        print(f"OCR准确率  原图 {ocr_accuracy(engine, images, texts):.3f}  "
+              f"PIL {ocr_accuracy(engine, pil_results, texts):.3f}  "
+              f"NumPy {ocr_accuracy(engine, numpy_results, texts):.3f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""导入耗时基准：用 `python -X importtime` 测量导入 pdfToDoc 的耗时，并检查重量级依赖没有被提前导入。
+
+    python benchmarks/import_time.py              # 使用默认预算
+    python benchmarks/import_time.py --budget-ms 80 --repeat 7
+
+超出预算或导入了被禁止的模块时以退出码1结束，可以直接放进CI作为回归检查。
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULE = "pdfToDoc"
+# 这些依赖只应在真正用到时才导入
+LAZY_MODULES = ("tkinter", "paddleocr", "paddle", "numpy", "PIL", "pdf2image", "docx", "requests")
+
+def measure_once():
+    """在全新的解释器中导入模块，返回 (累计耗时微秒, {模块名: 累计耗时微秒})"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {MODULE}"],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        env=dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"导入 {MODULE} 失败:\n{result.stderr}")
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((depth, name.strip(), int(cumulative)))
+    # 子模块在父模块之前输出：从 pdfToDoc 所在行向前，直到回到顶层为止都是它导入的模块
+    end = max(i for i, (depth, name, _) in enumerate(entries) if depth == 0 and name == MODULE)
+    start = end
+    while start > 0 and entries[start - 1][0] > 0:
+        start -= 1
+    modules = {name: cumulative for _, name, cumulative in entries[start:end + 1]}
+    return modules[MODULE], modules
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=100.0, help="导入耗时预算（毫秒，取多次中的最小值比较）")
+    parser.add_argument("--repeat", type=int, default=5, help="重复测量次数")
+    parser.add_argument("--top", type=int, default=10, help="列出最慢的N个模块")
+    args = parser.parse_args(argv)
+
+    runs = [measure_once() for _ in range(max(1, args.repeat))]
+    best_us, modules = min(runs, key=lambda run: run[0])
+    print(f"导入 {MODULE}: 最小 {best_us / 1000:.1f} ms，"
+          f"中位数 {sorted(run[0] for run in runs)[len(runs) // 2] / 1000:.1f} ms（预算 {args.budget_ms:.0f} ms）")
+    for name, cumulative in sorted(modules.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    failed = False
+    eager = sorted(name for name in modules if name.split(".")[0] in LAZY_MODULES)
+    if eager:
+        print(f"错误: 导入时加载了应延迟导入的模块: {', '.join(eager)}")
+        failed = True
+    if best_us / 1000 > args.budget_ms:
+        print("错误: 导入耗时超出预算")
+        failed = True
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,334 @@
+"""端到端转换基准：生成合成PDF，用本地模拟翻译服务无界面运行完整的 convert_pdf 流程。
+
+    python benchmarks/pipeline.py --pages 40 --words 250 --scanned 0.25
+    python benchmarks/pipeline.py --pages 20 --latency 0.8 --rpm 30 --error-rate 0.1 --runs 3
+    python benchmarks/pipeline.py --pages 40 --save baseline.json
+    python benchmarks/pipeline.py --pages 40 --baseline baseline.json --tolerance 0.15
+
+合成PDF由文字页（带嵌入文本层，可跳过OCR）和扫描页（只有图片，需要OCR）组成，--words
+控制每页文字量。模拟服务实现与真实接口相同的OpenAI兼容SSE流式响应，可配置首字节延迟、
+每分钟请求上限（超出时返回429和Retry-After）、随机5xx错误率以及在响应中途断开连接的比例，
+不访问外网、不消耗API额度。
+
+需要 poppler（渲染页面和读取文本层）；扫描页还需要 paddleocr，没有安装时可用 --scanned 0。
+翻译和OCR缓存在基准中默认关闭，保证每次运行的工作量相同。
+"""
+import io
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import statistics
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pdfToDoc
+from enhance import WORDS, synthetic_page
+
+PAGE_SIZE = (595, 842)      # A4，单位为点（1/72 英寸）
+LINE_WORDS = 12
+
+def _pdf_stream(data, entries=""):
+    return f"<< {entries} /Length {len(data)} >>\nstream\n".encode() + data + b"\nendstream"
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def text_page_lines(rng, words):
+    words = [rng.choice(WORDS) for _ in range(words)]
+    return [" ".join(words[i:i + LINE_WORDS]) for i in range(0, len(words), LINE_WORDS)]
+
+def write_pdf(path, pages):
+    """写出最小的PDF文件。pages 中每项为 ("text", 文本行列表) 或 ("image", JPEG字节, (宽, 高))"""
+    width, height = PAGE_SIZE
+    # 1号对象为Catalog、2号为Pages，等所有页面写完后再填入
+    objects = [None, None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in pages:
+        resources = "/Font << /F1 3 0 R >>"
+        if page[0] == "image":
+            _, jpeg, (image_width, image_height) = page
+            objects.append(_pdf_stream(jpeg, f"/Type /XObject /Subtype /Image /Width {image_width} "
+                                             f"/Height {image_height} /ColorSpace /DeviceRGB "
+                                             f"/BitsPerComponent 8 /Filter /DCTDecode"))
+            resources += f" /XObject << /Im1 {len(objects)} 0 R >>"
+            content = f"q {width} 0 0 {height} 0 0 cm /Im1 Do Q".encode()
+        else:
+            # 10号字、12点行距，一页最多约60行
+            ops = ["BT", "/F1 10 Tf", "12 TL", f"56 {height - 64} Td"]
+            ops.extend(f"({_pdf_escape(line)}) Tj T*" for line in page[1][:60])
+            ops.append("ET")
+            content = "\n".join(ops).encode('latin-1')
+        objects.append(_pdf_stream(content))
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}] "
+                       f"/Resources << {resources} >> /Contents {len(objects)} 0 R >>".encode())
+        kids.append(len(objects))
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{kid} 0 R' for kid in kids)}] /Count {len(kids)} >>".encode()
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    with open(path, 'wb') as f:
+        f.write(out.getvalue())
+
+def synthetic_pdf(path, pages, words, scanned=0.0, scan_dpi=200, seed=0):
+    """生成合成PDF，按 scanned 比例随机把部分页面做成只有图片的扫描页，返回扫描页页码"""
+    rng = random.Random(seed)
+    scanned_pages = set(rng.sample(range(1, pages + 1), int(round(pages * scanned))))
+    content = []
+    for number in range(1, pages + 1):
+        if number in scanned_pages:
+            image, _ = synthetic_page(seed * 100003 + number, dpi=scan_dpi)
+            buffer = io.BytesIO()
+            image.save(buffer, 'JPEG', quality=85)
+            content.append(("image", buffer.getvalue(), image.size))
+            image.close()
+        else:
+            content.append(("text", text_page_lines(rng, words)))
+    write_pdf(path, content)
+    return sorted(scanned_pages)
+
+class MockTranslationServer(ThreadingHTTPServer):
+    """本地OpenAI兼容的流式翻译服务：把用户消息中的原文加上“译:”前缀后分块流式返回，
+    <<<n>>> 分段标记原样保留，因此批量请求可以正常拆分；收到截断后的续译请求时只返回剩余部分"""
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, chunk_delay=0.0, chunk_chars=32, rpm=0, error_rate=0.0, cut_rate=0.0, seed=0):
+        super().__init__(("127.0.0.1", 0), _MockHandler)
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.chunk_chars = chunk_chars
+        self.rpm = rpm
+        self.error_rate = error_rate
+        self.cut_rate = cut_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.allowance = float(rpm)
+        self.last_refill = time.monotonic()
+        self.reset_stats()
+
+    @property
+    def endpoint(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1/chat/completions"
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {"requests": 0, "statuses": {}, "bytes_in": 0, "bytes_out": 0}
+
+    def count(self, status, bytes_in, bytes_out):
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["statuses"][str(status)] = self.stats["statuses"].get(str(status), 0) + 1
+            self.stats["bytes_in"] += bytes_in
+            self.stats["bytes_out"] += bytes_out
+
+    def admit(self):
+        """按每分钟请求上限放行，返回 (状态码, Retry-After秒数)"""
+        with self.lock:
+            if self.error_rate and self.rng.random() < self.error_rate:
+                return 503, None
+            if not self.rpm:
+                return 200, None
+            now = time.monotonic()
+            self.allowance = min(self.rpm, self.allowance + (now - self.last_refill) * self.rpm / 60)
+            self.last_refill = now
+            if self.allowance < 1:
+                return 429, math.ceil((1 - self.allowance) * 60 / self.rpm)
+            self.allowance -= 1
+            return 200, None
+
+    def should_cut(self):
+        with self.lock:
+            return bool(self.cut_rate) and self.rng.random() < self.cut_rate
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="mock-translation-server", daemon=True).start()
+        return self
+
+class _MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body=b"", headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        status, retry_after = server.admit()
+        if server.latency:
+            time.sleep(server.latency)
+        if status != 200:
+            headers = [("Retry-After", str(retry_after))] if retry_after is not None else []
+            self._reply(status, b"", headers)
+            server.count(status, len(body), 0)
+            return
+        payload = json.loads(body)
+        messages = payload["messages"]
+        prompt = messages[1]["content"]
+        # 第一行是翻译指令，其余是原文
+        source = prompt.split("\n", 1)[1] if "\n" in prompt else prompt
+        translated = "\n".join(line if pdfToDoc.SEGMENT_MARKER.fullmatch(line) else f"译: {line}"
+                               for line in source.split("\n"))
+        if len(messages) > 2 and messages[-2]["role"] == "assistant":
+            translated = translated[len(messages[-2]["content"]):]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        sent = 0
+        events = [{"choices": [{"delta": {"content": translated[i:i + server.chunk_chars]}}]}
+                  for i in range(0, len(translated), server.chunk_chars)]
+        events.append({"choices": [{"delta": {}}], "usage": {
+            "prompt_tokens": sum(pdfToDoc.estimate_tokens(m["content"]) for m in payload["messages"]),
+            "completion_tokens": pdfToDoc.estimate_tokens(translated)
+        }})
+        events.append("[DONE]")
+        if server.should_cut():
+            # 发出一半后直接断开，不写分块结束标记，模拟代理或网络在中途掐断连接
+            events = events[:len(events) // 2]
+            self.close_connection = True
+        for event in events:
+            data = ("data: " + (event if isinstance(event, str) else json.dumps(event, ensure_ascii=False))
+                    + "\n\n").encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+            sent += len(data)
+            if server.chunk_delay:
+                time.sleep(server.chunk_delay)
+        if self.close_connection:
+            server.count("cut", len(body), sent)
+            return
+        self.wfile.write(b"0\r\n\r\n")
+        server.count(200, len(body), sent)
+
+def benchmark_config(base, server, args):
+    """在基础配置上指向模拟服务，并关闭缓存，使每次运行的工作量相同"""
+    config = json.loads(json.dumps(base))
+    config["api_config"] = {"endpoint": server.endpoint, "key": "benchmark", "provider": "mock"}
+    cache_settings = config.setdefault("cache_settings", {})
+    cache_settings["translation"] = dict(cache_settings.get("translation", {}), enabled=args.cache)
+    cache_settings["ocr"] = dict(cache_settings.get("ocr", {}), enabled=args.cache)
+    config["report_settings"] = {"format": "", "profile": False}
+    # 始终输出单个文档，run_once 按输出文件统计体积
+    config["docx_settings"] = dict(config.get("docx_settings", {}), volume_pages=0)
+    return config
+
+def run_once(pdf_path, output_dir, run, server, args):
+    server.reset_stats()
+    output_file = os.path.join(output_dir, f"run{run}.docx")
+    start = time.perf_counter()
+    try:
+        pdfToDoc.convert_pdf(pdf_path, output_file, enhance=args.enhance, resume=False,
+                             use_text_layer=False if args.force_ocr else None, report="json")
+    except pdfToDoc.PartialConversionError:
+        # 错误率较高时个别页面重试后仍可能失败，文档照常生成，失败页数记在结果里
+        pass
+    elapsed = time.perf_counter() - start
+    with open(f"{output_file}.report.json", encoding='utf-8') as f:
+        report = json.load(f)
+    return {
+        "seconds": round(elapsed, 3),
+        "pages_per_second": round(args.pages / elapsed, 4),
+        "peak_rss_mb": report["peak_rss_mb"],
+        "failed_pages": len(report["failed_pages"]),
+        "docx_mb": round(os.path.getsize(output_file) / (1 << 20), 2),
+        "server": dict(server.stats),
+        "api": {key: report["api"][key] for key in
+                ("requests", "failures", "tokens_sent", "tokens_received",
+                 "rate_limit_wait_seconds", "latency_p50", "latency_p95")},
+        "stages": {stage: summary["wall_total"] for stage, summary in report["stages"].items()}
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=20, help="页数")
+    parser.add_argument("--words", type=int, default=250, help="文字页每页的单词数（最多约700）")
+    parser.add_argument("--scanned", type=float, default=0.25, help="只有图片、需要OCR的扫描页比例")
+    parser.add_argument("--scan-dpi", type=int, default=200, help="扫描页图片的分辨率")
+    parser.add_argument("--latency", type=float, default=0.3, help="模拟服务的首字节延迟（秒）")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="模拟服务每个SSE分块之间的间隔（秒）")
+    parser.add_argument("--rpm", type=int, default=0, help="模拟服务每分钟请求上限，超出返回429（0为不限）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟服务随机返回503的比例")
+    parser.add_argument("--cut-rate", type=float, default=0.0, help="模拟服务在响应中途断开连接的比例")
+    parser.add_argument("--runs", type=int, default=1, help="重复运行次数，汇总取中位数")
+    parser.add_argument("--enhance", action="store_true", help="开启图片增强")
+    parser.add_argument("--force-ocr", action="store_true", help="忽略文本层，所有页面都OCR")
+    parser.add_argument("--cache", action="store_true", help="保留翻译和OCR缓存（默认关闭）")
+    parser.add_argument("--config", help="基础配置文件（默认读取 PDFTODOC_CONFIG 或仓库的 config.json）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="把结果写入JSON文件，可作为之后比较的基线")
+    parser.add_argument("--baseline", help="与之前保存的结果比较，页/秒下降超过 --tolerance 时返回1")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args(argv)
+
+    config_path = args.config or os.environ.get(
+        'PDFTODOC_CONFIG', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.json'))
+    base = pdfToDoc.load_config(config_path) if os.path.exists(config_path) else {}
+    server = MockTranslationServer(latency=args.latency, chunk_delay=args.chunk_delay, rpm=args.rpm,
+                                   error_rate=args.error_rate, cut_rate=args.cut_rate, seed=args.seed).start()
+    pdfToDoc.set_config(benchmark_config(base, server, args))
+    pdfToDoc.configure_logging()
+
+    results = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="pdftodoc-bench-") as workdir:
+            pdf_path = os.path.join(workdir, "synthetic.pdf")
+            scanned = synthetic_pdf(pdf_path, args.pages, args.words, args.scanned, args.scan_dpi, args.seed)
+            print(f"{args.pages} 页（扫描页 {len(scanned)}），每页约 {args.words} 词，"
+                  f"PDF {os.path.getsize(pdf_path) / (1 << 20):.1f} MB；模拟服务延迟 {args.latency}s，"
+                  f"限速 {args.rpm or '无'}，错误率 {args.error_rate:.0%}")
+            for run in range(1, args.runs + 1):
+                result = run_once(pdf_path, workdir, run, server, args)
+                results.append(result)
+                statuses = ", ".join(f"{status}×{count}" for status, count in sorted(result["server"]["statuses"].items()))
+                print(f"第 {run} 次: {result['seconds']:7.2f} s  {result['pages_per_second']:6.2f} 页/秒  "
+                      f"内存峰值 {result['peak_rss_mb']} MB  API请求 {result['server']['requests']} 次（{statuses}）  "
+                      f"延迟 p50 {result['api']['latency_p50']} s / p95 {result['api']['latency_p95']} s"
+                      + (f"  失败 {result['failed_pages']} 页" if result["failed_pages"] else ""))
+                print("    " + "  ".join(f"{stage} {seconds:.2f}s" for stage, seconds in result["stages"].items()))
+    finally:
+        server.shutdown()
+        pdfToDoc.shutdown_ocr_pool()
+        pdfToDoc.shutdown_async_translation_client()
+
+    pages_per_second = statistics.median(result["pages_per_second"] for result in results)
+    summary = {"args": vars(args), "pages_per_second": pages_per_second, "runs": results}
+    print(f"中位数 {pages_per_second:.2f} 页/秒")
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)["pages_per_second"]
+        change = pages_per_second / baseline - 1
+        print(f"基线 {baseline:.2f} 页/秒，变化 {change:+.1%}")
+        if change < -args.tolerance:
+            print("性能回退超过容差")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,206 +1,2292 @@
 import os
-import gc
 import sys
 import time
 import json
 import logging
 import threading
 import subprocess
-import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
 import re
-import requests
-from PIL import Image, ImageEnhance
-import numpy as np
-from pdf2image import convert_from_path
-from paddleocr import PaddleOCR
-from docx import Document
-from docx.shared import Inches
-from docx.oxml.ns import nsdecls
-from docx.oxml import parse_xml
 import shutil
+import argparse
 import queue
+import sqlite3
+import hashlib
+import io
+import random
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor
 
-# 配置日志
-logging.basicConfig(
-    filename='app.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+# requests、Pillow、pdf2image、PaddleOCR 等重量级依赖都在首次使用时才导入，
+# 图形界面模块只在打开GUI时导入（见 run_gui），因此本模块可以作为库快速导入
+tk = filedialog = messagebox = ttk = None
 
-# 从配置文件中读取API设置
-with open('config.json') as f:
-    config = json.load(f)
-API_ENDPOINT = config['api_config']['endpoint']
-AI_API_KEY = config['api_config']['key']
 REQUEST_TIMEOUT = 30    # API请求超时时间
+CONFIG_PATH = os.environ.get('PDFTODOC_CONFIG', 'config.json')
+
+_config = None
+_config_lock = threading.Lock()
+
+def load_config(path=None):
+    """从JSON文件读取配置"""
+    with open(path or CONFIG_PATH, encoding='utf-8') as f:
+        return json.load(f)
+
+def set_config(new_config):
+    """注入配置字典（作为库使用或测试时无需config.json）"""
+    global _config
+    with _config_lock:
+        _config = new_config
+
+def get_config():
+    """返回当前配置，首次访问时才读取配置文件"""
+    global _config
+    with _config_lock:
+        if _config is None:
+            _config = load_config()
+        return _config
+
+def get_settings(section):
+    return get_config().setdefault(section, {})
+
+def configure_logging(filename='app.log'):
+    logging.basicConfig(
+        filename=filename,
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+def translation_workers():
+    """并发翻译请求数"""
+    return get_settings('translation_settings').get('max_workers', 8)
 
 class APIRateLimiter:
-    """API速率限制器"""
-    def __init__(self, calls_per_minute=30):
-        self.interval = 60 / calls_per_minute
-        self.last_call = 0
+    """线程安全的令牌桶速率限制器，同时限制每分钟请求数和每分钟token数"""
+    def __init__(self, calls_per_minute=30, tokens_per_minute=None):
+        self.request_capacity = float(calls_per_minute)
+        self.token_capacity = float(tokens_per_minute) if tokens_per_minute else None
+        self.request_tokens = self.request_capacity
+        self.token_tokens = self.token_capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.last_refill
+        self.last_refill = now
+        self.request_tokens = min(self.request_capacity,
+                                  self.request_tokens + elapsed * self.request_capacity / 60)
+        if self.token_capacity is not None:
+            self.token_tokens = min(self.token_capacity,
+                                    self.token_tokens + elapsed * self.token_capacity / 60)
+
+    def try_acquire(self, tokens=0):
+        """不阻塞地尝试发出一次请求：成功时扣除额度并返回0，否则返回还需等待的秒数"""
+        if self.token_capacity is not None:
+            tokens = min(tokens, self.token_capacity)
+        with self.lock:
+            self._refill()
+            request_wait = (1 - self.request_tokens) * 60 / self.request_capacity
+            token_wait = 0
+            if self.token_capacity is not None:
+                token_wait = (tokens - self.token_tokens) * 60 / self.token_capacity
+            wait_time = max(request_wait, token_wait)
+            if wait_time <= 0:
+                self.request_tokens -= 1
+                if self.token_capacity is not None:
+                    self.token_tokens -= tokens
+                return 0
+            return wait_time
+
+    def acquire(self, tokens=0):
+        """阻塞直到可以发出一次消耗 tokens 个token的请求"""
+        while True:
+            wait_time = self.try_acquire(tokens)
+            if wait_time <= 0:
+                return
+            time.sleep(wait_time)
+
+    async def acquire_async(self, tokens=0):
+        """acquire 的协程版本，等待时不占用线程"""
+        import asyncio
+        while True:
+            wait_time = self.try_acquire(tokens)
+            if wait_time <= 0:
+                return
+            await asyncio.sleep(wait_time)
 
     def wait(self):
-        elapsed = time.time() - self.last_call
-        if elapsed < self.interval:
-            time.sleep(self.interval - elapsed)
-        self.last_call = time.time()
+        self.acquire()
 
-def ocr_text(image_path):
-    """使用PaddleOCR进行文字识别（不进行方向识别）"""
-    try:
-        if not hasattr(ocr_text, "ocr_engine"):
-            ocr_text.ocr_engine = PaddleOCR(
-                lang='en',
-                use_gpu=False,
-                total_process=4
+class CircuitBreaker:
+    """线程安全的熔断器：服务连续故障达到阈值后断开，冷却期内拒绝请求，
+    冷却结束后只放行一个试探请求，成功则恢复，失败则重新断开"""
+    PROBE_POLL = 0.5    # 试探请求进行中时，其他请求轮询熔断器状态的间隔（秒）
+
+    def __init__(self, failure_threshold=5, reset_timeout=60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self.lock:
+            if self.opened_at is None:
+                return "closed"
+            if self.probing or time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        """是否允许发出请求；冷却结束后第一个调用者获得试探资格，返回 "probe"，
+        之后须以 record_success()/record_failure()/release() 之一结束试探"""
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if not self.probing and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.probing = True
+                return "probe"
+            return False
+
+    def retry_in(self):
+        """被拒绝的请求距离下次可能放行还需等待的秒数"""
+        with self.lock:
+            if self.opened_at is None:
+                return 0.0
+            remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+            return remaining if remaining > 0 else self.PROBE_POLL
+
+    def release(self):
+        """试探请求没有得出服务是否恢复的结论（被限速、请求本身有误或被取消），交还试探资格"""
+        with self.lock:
+            self.probing = False
+
+    def record_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                logging.info("翻译服务已恢复，熔断器关闭")
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+                logging.warning(f"翻译请求连续失败 {self.failures} 次，熔断 {self.reset_timeout} 秒")
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+class TranslationResult:
+    """一次翻译请求的结果；失败时 text 为None，error 记录最后一次失败原因"""
+    def __init__(self, text=None, error=None, status=None, attempts=0):
+        self.text = text
+        self.error = error
+        self.status = status
+        self.attempts = attempts
+
+    @property
+    def ok(self):
+        return self.error is None and self.text is not None
+
+    def __repr__(self):
+        if self.ok:
+            return f"TranslationResult(ok, {len(self.text)} chars, attempts={self.attempts})"
+        return f"TranslationResult(error={self.error!r}, status={self.status}, attempts={self.attempts})"
+
+_rate_limiter = None
+_circuit_breaker = None
+_http_session = None
+_http_session_lock = threading.Lock()
+_translation_executor = None
+
+def get_rate_limiter():
+    """返回按配置创建的共享速率限制器"""
+    global _rate_limiter
+    with _http_session_lock:
+        if _rate_limiter is None:
+            settings = get_settings('translation_settings')
+            _rate_limiter = APIRateLimiter(
+                calls_per_minute=settings.get('requests_per_minute', 60),
+                tokens_per_minute=settings.get('tokens_per_minute')
             )
-        result = ocr_text.ocr_engine.ocr(image_path, cls=False)
-        if not result:
-            return ""
-        recognized_text = "\n".join([line[1][0] for group in result for line in group])
-        return recognized_text
-    except Exception as e:
-        messagebox.showerror("错误", f"OCR识别失败: {str(e)}")
-        logging.error(f"OCR识别失败: {str(e)}")
+        return _rate_limiter
+
+def get_circuit_breaker():
+    """返回按配置创建的共享熔断器"""
+    global _circuit_breaker
+    with _http_session_lock:
+        if _circuit_breaker is None:
+            settings = get_settings('translation_settings')
+            _circuit_breaker = CircuitBreaker(
+                failure_threshold=settings.get('breaker_failures', 5),
+                reset_timeout=settings.get('breaker_reset', 60)
+            )
+        return _circuit_breaker
+
+def get_http_session():
+    """返回共享的keep-alive会话，连接池大小与并发翻译数一致"""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=translation_workers())
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http_session = session
+        return _http_session
+
+def get_translation_executor():
+    """返回共享的翻译线程池"""
+    global _translation_executor
+    with _http_session_lock:
+        if _translation_executor is None:
+            _translation_executor = ThreadPoolExecutor(
+                max_workers=translation_workers(),
+                thread_name_prefix="translate"
+            )
+        return _translation_executor
+
+_async_client = None
+_async_client_checked = False
+
+def get_async_translation_client():
+    """返回共享的异步翻译客户端；配置关闭或没有安装aiohttp时返回None，由线程池发送请求"""
+    global _async_client, _async_client_checked
+    with _http_session_lock:
+        if _async_client is None and not _async_client_checked:
+            _async_client_checked = True
+            settings = get_settings('translation_settings')
+            if settings.get('async_client', True):
+                from importlib.util import find_spec
+                if find_spec("aiohttp") is None:
+                    logging.info("未安装aiohttp，翻译请求使用线程池发送")
+                else:
+                    _async_client = AsyncTranslationClient(max_streams=settings.get('max_streams', 64))
+        return _async_client
+
+def shutdown_async_translation_client():
+    """取消未完成的异步翻译请求并停止事件循环"""
+    global _async_client, _async_client_checked
+    with _http_session_lock:
+        client, _async_client = _async_client, None
+        _async_client_checked = False
+    if client is not None:
+        client.close()
+
+def estimate_tokens(text):
+    """粗略估算token数：中日韩字符按1个token计，其余字符约4个字符1个token"""
+    cjk = len(re.findall(r'[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]', text))
+    return cjk + (len(text) - cjk) // 4 + 1
+
+TRANSLATION_MODEL = "deepseek-ai/DeepSeek-V3"
+PROMPT_VERSION = 1    # 修改系统提示词或请求模板时递增，使旧的翻译缓存失效
+SYSTEM_PROMPT = ("你是一个中英文翻译专家，将用户输入的中文翻译成英文，"
+                 "或将用户输入的英文翻译成中文。对于非中文内容，它将提供中文翻译结果。"
+                 "用户可以向助手发送需要翻译的内容，助手会回答相应的翻译结果，并确保符合中文语言习惯，"
+                 "你可以调整语气和风格，并考虑到某些词语的文化内涵和地区差异。"
+                 "同时作为翻译家，需将原文翻译成具有信达雅标准的译文。"
+                 "\"信\" 即忠实于原文的内容与意图；"
+                 "\"达\" 意味着译文应通顺易懂，表达清晰；"
+                 "\"雅\" 则追求译文的文化审美和语言的优美。"
+                 "目标是创作出既忠于原作精神，又符合目标语言文化和读者审美的翻译。")
+
+def make_cache_key(*parts):
+    """对缓存键的各组成部分做稳定的SHA-256哈希"""
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+class SQLiteCache:
+    """基于SQLite的持久化键值缓存，支持按存活时间和条目数淘汰（最久未访问优先）"""
+    def __init__(self, path, max_entries=50000, max_age_days=None):
+        self.path = os.path.expanduser(path)
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400 if max_age_days else None
+        self.hits = 0
+        self.misses = 0
+        self.puts_since_evict = 0
+        self.lock = threading.Lock()
+        cache_dir = os.path.dirname(self.path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON cache(last_access)")
+        self.conn.commit()
+        self.evict()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT value, created_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.max_age and now - row[1] > self.max_age):
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, value):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            self.conn.commit()
+            self.puts_since_evict += 1
+            need_evict = self.puts_since_evict >= 500
+        if need_evict:
+            self.evict()
+
+    def evict(self):
+        """删除过期条目，并在超出容量时按最久未访问顺序淘汰"""
+        with self.lock:
+            if self.max_age:
+                self.conn.execute("DELETE FROM cache WHERE created_at < ?", (time.time() - self.max_age,))
+            if self.max_entries:
+                self.conn.execute(
+                    "DELETE FROM cache WHERE key IN ("
+                    "SELECT key FROM cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+            self.conn.commit()
+            self.puts_since_evict = 0
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM cache")
+            self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+_translation_cache = None
+_cache_lock = threading.Lock()
+
+def get_translation_cache():
+    """返回共享的翻译缓存；在配置中关闭缓存时返回None"""
+    global _translation_cache
+    settings = get_settings('cache_settings').get('translation', {})
+    if not settings.get('enabled', True):
+        return None
+    with _cache_lock:
+        if _translation_cache is None:
+            _translation_cache = SQLiteCache(
+                settings.get('path', '~/.pdfToDoc/translation_cache.sqlite3'),
+                max_entries=settings.get('max_entries', 50000),
+                max_age_days=settings.get('max_age_days', 180)
+            )
+        return _translation_cache
+
+def ocr_lang():
+    return get_settings('ocr_settings').get('lang', 'en')
+
+_ocr_engine_version = None
+
+def ocr_engine_version():
+    """从包元数据读取PaddleOCR版本，避免仅为计算缓存键而导入paddleocr"""
+    global _ocr_engine_version
+    if _ocr_engine_version is None:
+        try:
+            from importlib.metadata import version
+            _ocr_engine_version = f"paddleocr-{version('paddleocr')}"
+        except Exception:
+            _ocr_engine_version = "paddleocr-unknown"
+    return _ocr_engine_version
+
+_ocr_cache = None
+
+def get_ocr_cache():
+    """返回共享的OCR结果缓存；在配置或命令行中关闭缓存时返回None"""
+    global _ocr_cache
+    settings = get_settings('cache_settings').get('ocr', {})
+    if not settings.get('enabled', True):
         return None
+    with _cache_lock:
+        if _ocr_cache is None:
+            _ocr_cache = SQLiteCache(
+                settings.get('path', '~/.pdfToDoc/ocr_cache.sqlite3'),
+                max_entries=settings.get('max_entries', 20000)
+            )
+        return _ocr_cache
+
+def image_fingerprint(image):
+    """按解码后的像素内容计算页面哈希，与文件名和PNG编码参数无关；image 可以是路径或PIL图像"""
+    if isinstance(image, (str, os.PathLike)):
+        from PIL import Image
+        with Image.open(image) as opened:
+            return image_fingerprint(opened)
+    digest = hashlib.sha256(image.tobytes())
+    digest.update(f"{image.mode}:{image.size}".encode('utf-8'))
+    return digest.hexdigest()
+
+def ocr_input(image):
+    """转换为PaddleOCR的输入：路径原样返回，PIL图像转为BGR顺序的numpy数组，避免编码成文件再解码"""
+    if isinstance(image, (str, os.PathLike)):
+        return image
+    import numpy as np
+    return np.ascontiguousarray(np.asarray(image.convert('RGB'))[:, :, ::-1])
+
+def create_ocr_engine(cpu_threads=None):
+    from paddleocr import PaddleOCR
+    kwargs = {"lang": ocr_lang(), "use_gpu": False}
+    if cpu_threads:
+        kwargs["cpu_threads"] = cpu_threads
+    else:
+        kwargs["total_process"] = 4
+    return PaddleOCR(**kwargs)
+
+def parse_ocr_result(result):
+    """把PaddleOCR的原始输出转换为 [{"box", "text", "confidence"}]"""
+    lines = []
+    for group in result or []:
+        for box, (text, confidence) in group or []:
+            lines.append({
+                "box": [[float(x), float(y)] for x, y in box],
+                "text": text,
+                "confidence": float(confidence)
+            })
+    return lines
+
+def ocr_cache_key(image, dpi=None):
+    return make_cache_key(image_fingerprint(image), dpi or get_settings('ocr_settings')['dpi'],
+                          ocr_lang(), ocr_engine_version())
+
+_worker_ocr_engine = None
+
+def _init_ocr_worker(worker_config, cpu_threads):
+    """OCR子进程初始化：沿用父进程的配置，限制数学库线程数，并且每个进程只加载一次OCR引擎"""
+    global _worker_ocr_engine
+    set_config(worker_config)
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[name] = str(cpu_threads)
+    _worker_ocr_engine = create_ocr_engine(cpu_threads=cpu_threads)
+
+def _run_ocr_job(page_index, image):
+    return page_index, parse_ocr_result(_worker_ocr_engine.ocr(image, cls=False))
+
+class OCRWorkerPool:
+    """多进程OCR池：每个工作进程持有自己的PaddleOCR引擎，页面按提交顺序排队，结果携带页序号返回。
+
+    工作进程意外退出（如内存不足被系统杀掉）后整个进程池会失效，recognize() 会重建
+    进程池并把该页重做一次；重做仍然失败时抛出 ConversionError 结束本次转换，
+    而不是让之后的每一页都失败。
+    """
+    def __init__(self, workers=None, threads_per_worker=None):
+        settings = get_settings('ocr_settings')
+        self.threads_per_worker = threads_per_worker or settings.get('threads_per_worker', 2)
+        self.workers = workers or settings.get('workers') or max(1, (os.cpu_count() or 1) // self.threads_per_worker)
+        self.lock = threading.Lock()
+        self.executor = self._create_executor()
+
+    def _create_executor(self):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # 使用spawn避免在已有GUI线程和翻译线程的进程中fork
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_ocr_worker,
+            initargs=(get_config(), self.threads_per_worker)
+        )
+
+    def restart(self, broken):
+        """用新的进程池替换已失效的 broken；多个线程同时发现失效时只重建一次"""
+        with self.lock:
+            if self.executor is broken:
+                logging.warning("OCR工作进程意外退出，重建OCR进程池")
+                broken.shutdown(wait=False)
+                self.executor = self._create_executor()
+
+    def submit(self, page_index, image, dpi=None):
+        """提交一页OCR（路径或PIL图像），返回Future，结果为 (page_index, lines)；缓存命中时直接返回已完成的Future"""
+        cache = get_ocr_cache()
+        cache_key = None
+        if cache is not None:
+            cache_key = ocr_cache_key(image, dpi)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                future = Future()
+                future.set_result((page_index, json.loads(cached)))
+                return future
+        from concurrent.futures.process import BrokenProcessPool
+        executor = self.executor
+        try:
+            future = executor.submit(_run_ocr_job, page_index, ocr_input(image))
+        except BrokenProcessPool:
+            # 进程池在之前的任务中已经失效
+            self.restart(executor)
+            future = self.executor.submit(_run_ocr_job, page_index, ocr_input(image))
+        future.executor = executor
+        if cache is not None:
+            def store(done):
+                if not done.cancelled() and done.exception() is None:
+                    cache.put(cache_key, json.dumps(done.result()[1], ensure_ascii=False))
+            future.add_done_callback(store)
+        return future
+
+    def recognize(self, page_index, image, dpi=None):
+        """同步识别一页，返回 (page_index, lines)；工作进程崩溃时重建进程池并重做一次"""
+        from concurrent.futures.process import BrokenProcessPool
+        future = self.submit(page_index, image, dpi=dpi)
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            self.restart(future.executor)
+        future = self.submit(page_index, image, dpi=dpi)
+        try:
+            return future.result()
+        except BrokenProcessPool as e:
+            self.restart(future.executor)
+            raise ConversionError(f"第 {page_index} 页OCR时工作进程反复崩溃（可能是内存不足），已停止转换") from e
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+_ocr_pool = None
 
-def split_text_into_chunks(text, max_length=1000):
-    sentences = re.split(r'(?<=[。.!?])', text)
+def get_ocr_pool():
+    """返回共享的OCR进程池，首次使用时创建"""
+    global _ocr_pool
+    with _cache_lock:
+        if _ocr_pool is None:
+            _ocr_pool = OCRWorkerPool()
+        return _ocr_pool
+
+def shutdown_ocr_pool():
+    global _ocr_pool
+    with _cache_lock:
+        if _ocr_pool is not None:
+            _ocr_pool.shutdown()
+            _ocr_pool = None
+
+def translation_budget():
+    """返回 (单次请求的输出token上限, 单次请求可放入的原文token上限)"""
+    settings = get_settings('translation_settings')
+    max_output = settings.get('max_output_tokens', 1024)
+    # 译文通常比原文占用更多token（英译中约1.2~1.5倍），按比例预留输出空间，避免译文被截断
+    return max_output, int(max_output / settings.get('output_ratio', 1.5))
+
+def split_text_into_chunks(text, max_tokens=None):
+    """按句子边界切分文本，使每块的估算token数不超过 max_tokens（默认按输出预算计算）"""
+    if max_tokens is None:
+        max_tokens = translation_budget()[1]
+    sentences = re.split(r'(?<=[。.!?！？\n])', text)
     chunks = []
     current_chunk = ""
+    current_tokens = 0
     for sentence in sentences:
-        if len(current_chunk) + len(sentence) > max_length:
-            if current_chunk:
-                chunks.append(current_chunk.strip())
-                current_chunk = sentence
-            else:
-                chunks.append(sentence.strip())
-                current_chunk = ""
+        tokens = estimate_tokens(sentence)
+        if tokens > max_tokens:
+            # 超长的单句按估算的字符数硬切
+            step = max(1, len(sentence) * max_tokens // tokens)
+            pieces = [sentence[i:i + step] for i in range(0, len(sentence), step)]
         else:
-            current_chunk += sentence
-    if current_chunk:
+            pieces = [sentence]
+        for piece in pieces:
+            tokens = estimate_tokens(piece)
+            if current_chunk and current_tokens + tokens > max_tokens:
+                chunks.append(current_chunk.strip())
+                current_chunk, current_tokens = "", 0
+            current_chunk += piece
+            current_tokens += tokens
+    if current_chunk.strip():
         chunks.append(current_chunk.strip())
     return chunks
 
-def translate_text(text, target_language):
+def pack_segments(token_counts, max_tokens):
+    """按顺序把文本段装入请求，每个请求的原文token数不超过 max_tokens，返回每个请求包含的段下标"""
+    batches = []
+    current, current_tokens = [], 0
+    for index, tokens in enumerate(token_counts):
+        if current and current_tokens + tokens > max_tokens:
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(index)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+SEGMENT_MARKER = re.compile(r'<<<(\d+)>>>')
+
+def _batch_prompt(segments, target_language):
+    """把多段原文用 <<<n>>> 标记拼成一个请求，返回 (请求文本, 翻译指令)"""
+    text = "\n".join(f"<<<{i}>>>\n{segment}" for i, segment in enumerate(segments, 1))
+    instruction = (f"请专业准确地把下面每一段分别翻译成{target_language}，保留所有数字和格式。"
+                   f"每段以 <<<编号>>> 开头，译文中请在对应段落前原样保留同样的标记，不要合并或省略段落：")
+    return text, instruction
+
+def _split_batch(result, count):
+    """按标记把批量请求的译文拆回各段；标记不完整时返回None"""
+    parts = SEGMENT_MARKER.split(result.text)
+    results = {}
+    for number, content in zip(parts[1::2], parts[2::2]):
+        results[int(number)] = content.strip()
+    if not all(results.get(i) for i in range(1, count + 1)):
+        return None
+    return [TranslationResult(text=results[i], status=result.status, attempts=result.attempts)
+            for i in range(1, count + 1)]
+
+def _batch_requests(segments, target_language):
+    """批量翻译的决策过程，同步和异步两种传输共用。
+
+    生成器每次 yield 一组待发送的请求 [(文本, 翻译指令)]，调用方发送后把对应的
+    TranslationResult 列表 send() 回来；最终的返回值是与 segments 一一对应的结果。
+    多段原文放进一个请求，用 <<<n>>> 标记分隔并按标记拆回；标记对不上时逐段单独请求。
+    """
+    if len(segments) == 1:
+        return (yield [(segments[0], None)])
+    result, = yield [_batch_prompt(segments, target_language)]
+    if not result.ok:
+        # 请求本身失败（已重试过）时不再逐段重发，避免对故障服务成倍放大请求量
+        return [result] * len(segments)
+    results = _split_batch(result, len(segments))
+    if results is not None:
+        return results
+    logging.warning(f"批量翻译结果的分段标记不完整，改为逐段翻译 {len(segments)} 段")
+    return (yield [(segment, None) for segment in segments])
+
+def _translate_batch(segments, target_language, metrics=None):
+    """在当前线程中逐个发送 _batch_requests 的请求，返回与 segments 一一对应的 TranslationResult"""
+    steps = _batch_requests(segments, target_language)
+    results = None
     try:
-        max_retries = 3
-        timeout = 60
-        url = API_ENDPOINT
-        headers = {
-            "Authorization": f"Bearer {AI_API_KEY}",
-            "Content-Type": "application/json",
-            "accept": "application/json"
-        }
-        payload = {
-            "model": "deepseek-ai/DeepSeek-V3",
-            "messages": [
-                {
-                    "role": "system",
-                    "content": ("你是一个中英文翻译专家，将用户输入的中文翻译成英文，"
-                                "或将用户输入的英文翻译成中文。对于非中文内容，它将提供中文翻译结果。"
-                                "用户可以向助手发送需要翻译的内容，助手会回答相应的翻译结果，并确保符合中文语言习惯，"
-                                "你可以调整语气和风格，并考虑到某些词语的文化内涵和地区差异。"
-                                "同时作为翻译家，需将原文翻译成具有信达雅标准的译文。"
-                                "\"信\" 即忠实于原文的内容与意图；"
-                                "\"达\" 意味着译文应通顺易懂，表达清晰；"
-                                "\"雅\" 则追求译文的文化审美和语言的优美。"
-                                "目标是创作出既忠于原作精神，又符合目标语言文化和读者审美的翻译。")
-                },
-                {
-                    "role": "user",
-                    "content": f"请专业准确地翻译成{target_language}，保留所有数字和格式：\n{text}"
-                }
-            ],
-            "stream": True,
-            "max_tokens": 512,
-            "temperature": 0.7,
-            "top_p": 0.7,
-            "top_k": 50,
-            "frequency_penalty": 0.5,
-            "n": 1
-        }
-        for attempt in range(max_retries):
-            try:
-                response = requests.post(url, headers=headers, json=payload, stream=True, timeout=timeout)
-                if response.status_code == 200:
-                    aggregated_text = ""
-                    for line in response.iter_lines():
-                        if line:
-                            decoded_line = line.decode('utf-8').strip()
-                            if decoded_line == "[DONE]":
-                                continue
-                            if decoded_line.startswith("data:"):
-                                decoded_line = decoded_line[5:].strip()
-                            if not decoded_line or decoded_line[0] != '{':
-                                logging.warning(f"跳过不符合格式的chunk: {decoded_line}")
-                                continue
-                            try:
-                                data = json.loads(decoded_line)
-                                delta = data.get("choices", [{}])[0].get("delta", {})
-                                content = delta.get("content")
-                                if content:
-                                    aggregated_text += content
-                            except Exception as e:
-                                logging.error(f"解析翻译chunk出错: {e}")
-                    return aggregated_text
-                else:
-                    messagebox.showerror("错误", f"翻译请求失败，状态码：{response.status_code}")
-                    logging.error(f"翻译请求失败，状态码：{response.status_code}")
-                    return None
-            except requests.exceptions.Timeout:
-                if attempt < max_retries - 1:
-                    logging.warning(f"翻译超时，正在重试 ({attempt+1}/{max_retries})...")
-                    continue
-                else:
-                    messagebox.showerror("错误", "翻译服务响应超时")
-                    logging.error("翻译服务响应超时")
-                    return None
+        while True:
+            batch = steps.send(results)
+            results = [_request_translation(text, target_language, instruction=instruction, metrics=metrics)
+                       for text, instruction in batch]
+    except StopIteration as done:
+        return done.value
+
+def translate_segments(segments, target_language, metrics=None):
+    """翻译一组文本段，返回与输入一一对应的 TranslationResult。
+
+    先查翻译缓存并合并重复的段（如每页相同的页眉页脚），剩余的段按token预算
+    打包成尽量少的请求并发发送：安装了aiohttp时在异步客户端的事件循环中多路复用，
+    否则使用翻译线程池。
+    """
+    cache = get_translation_cache()
+    results = [None] * len(segments)
+    positions = {}
+    for index, segment in enumerate(segments):
+        positions.setdefault(segment, []).append(index)
+    pending = []
+    for segment, indexes in positions.items():
+        cached = None
+        if cache is not None:
+            cached = cache.get(make_cache_key(segment, target_language, TRANSLATION_MODEL, PROMPT_VERSION))
+        if cached is not None:
+            for index in indexes:
+                results[index] = TranslationResult(text=cached)
+        else:
+            pending.append(segment)
+    if not pending:
+        return results
+    batches = pack_segments([estimate_tokens(segment) for segment in pending], translation_budget()[1])
+    client = get_async_translation_client()
+    if client is not None:
+        futures = [client.submit(client.translate_batch([pending[i] for i in batch], target_language, metrics))
+                   for batch in batches]
+    else:
+        executor = get_translation_executor()
+        futures = [executor.submit(_translate_batch, [pending[i] for i in batch], target_language, metrics)
+                   for batch in batches]
+    try:
+        for batch, future in zip(batches, futures):
+            for i, result in zip(batch, future.result()):
+                segment = pending[i]
+                if result.ok and result.text and cache is not None:
+                    cache.put(make_cache_key(segment, target_language, TRANSLATION_MODEL, PROMPT_VERSION), result.text)
+                for index in positions[segment]:
+                    results[index] = result
+    except BaseException:
+        # 调用方被中断时取消还在排队或传输中的请求
+        for future in futures:
+            future.cancel()
+        raise
+    logging.info(f"翻译 {len(segments)} 段：缓存命中 {len(positions) - len(pending)} 段，"
+                 f"发送 {len(batches)} 个请求")
+    return results
+
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+CONTINUE_PROMPT = "上面的译文在中途被截断了。请从截断处继续输出剩余的译文，不要重复已经输出的内容，也不要添加任何说明。"
+
+class RequestDeadlineExceeded(Exception):
+    """流式响应超过单次请求的总时限"""
+
+def retry_after_seconds(response):
+    """解析 Retry-After 响应头（秒数或HTTP日期），无法解析时返回None"""
+    value = response.headers.get("Retry-After")
+    if not value:
         return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    from email.utils import parsedate_to_datetime
+    from datetime import datetime, timezone
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """指数退避加全抖动：在 [0, min(cap, base*2^attempt)] 内随机等待，避免并发请求同时重试"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+class SSEParser:
+    """增量解析OpenAI兼容的SSE流式响应。
+
+    feed() 接收任意切分的字节块，跨块的半行留到下一块再处理；译文片段追加到列表
+    缓冲区，读取 text 时才拼接一次。流以 [DONE] 或非 length 的 finish_reason 结束
+    时 complete 为True，否则说明流在中途被截断（或因 max_tokens 被截断）。
+    """
+    def __init__(self):
+        self.parts = []
+        self.pending = b""
+        self.usage = {}
+        self.finish_reason = None
+        self.done = False
+
+    def feed(self, data):
+        if self.pending:
+            data = self.pending + data
+        lines = data.split(b"\n")
+        self.pending = lines.pop()
+        for line in lines:
+            self._parse_line(line)
+
+    def close(self):
+        """处理流结束时没有换行的最后一行"""
+        if self.pending:
+            self._parse_line(self.pending)
+            self.pending = b""
+
+    def _parse_line(self, line):
+        line = line.strip()
+        # 空行是事件分隔符，冒号开头是注释（常用作心跳）
+        if not line or line.startswith(b":"):
+            return
+        if line.startswith(b"data:"):
+            line = line[5:].lstrip()
+        elif line.startswith((b"event:", b"id:", b"retry:")):
+            return
+        if line == b"[DONE]":
+            self.done = True
+            return
+        if not line.startswith(b"{"):
+            logging.warning(f"跳过不符合格式的chunk: {line[:200].decode('utf-8', 'replace')}")
+            return
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            logging.error(f"解析翻译chunk出错: {e}")
+            return
+        self.usage = data.get("usage") or self.usage
+        choice = (data.get("choices") or [{}])[0]
+        content = (choice.get("delta") or {}).get("content")
+        if content:
+            self.parts.append(content)
+        if choice.get("finish_reason"):
+            self.finish_reason = choice["finish_reason"]
+
+    @property
+    def text(self):
+        return "".join(self.parts)
+
+    @property
+    def complete(self):
+        return self.done or (self.finish_reason is not None and self.finish_reason != "length")
+
+def _read_translation_stream(response, deadline, parser):
+    """把流式响应按到达的字节块交给 parser；超过 deadline（monotonic时间）时抛出 RequestDeadlineExceeded"""
+    for chunk in response.iter_content(chunk_size=None):
+        if time.monotonic() > deadline:
+            raise RequestDeadlineExceeded("流式响应超过请求总时限")
+        parser.feed(chunk)
+    parser.close()
+    return parser
+
+def _translation_request(text, target_language, instruction=None):
+    """组装翻译请求，返回 (url, headers, payload, 估算的输入token数)"""
+    api_config = get_config()['api_config']
+    headers = {
+        "Authorization": f"Bearer {api_config['key']}",
+        "Content-Type": "application/json",
+        "accept": "application/json"
+    }
+    payload = {
+        "model": TRANSLATION_MODEL,
+        "messages": [
+            {
+                "role": "system",
+                "content": SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": f"{instruction or f'请专业准确地翻译成{target_language}，保留所有数字和格式：'}\n{text}"
+            }
+        ],
+        "stream": True,
+        "max_tokens": translation_budget()[0],
+        "temperature": 0.7,
+        "top_p": 0.7,
+        "top_k": 50,
+        "frequency_penalty": 0.5,
+        "n": 1
+    }
+    prompt_tokens = sum(estimate_tokens(message["content"]) for message in payload["messages"])
+    return api_config['endpoint'], headers, payload, prompt_tokens
+
+def _continuation_payload(payload, partial):
+    """流在中途被截断时，把已收到的译文作为助手消息发回，只请求剩余部分"""
+    if not partial:
+        return payload
+    return dict(payload, messages=payload["messages"] + [
+        {"role": "assistant", "content": partial},
+        {"role": "user", "content": CONTINUE_PROMPT}
+    ])
+
+def _retry_settings():
+    settings = get_settings('translation_settings')
+    return {
+        "max_retries": max(1, settings.get('max_retries', 5)),
+        "backoff_base": settings.get('backoff_base', 1.0),
+        "backoff_max": settings.get('backoff_max', 60),
+        "connect_timeout": settings.get('connect_timeout', 10),
+        "read_timeout": settings.get('read_timeout', 60),
+        "request_deadline": settings.get('request_deadline', 180)
+    }
+
+def _retry_delay(attempt, retry_after, settings):
+    delay = backoff_delay(attempt, settings["backoff_base"], settings["backoff_max"])
+    return max(delay, retry_after) if retry_after is not None else delay
+
+class TranslationAttempts:
+    """一次翻译请求的重试状态机，同步（requests）和异步（aiohttp）两种传输共用。
+
+    连接错误、超时、429和5xx按指数退避加抖动重试（优先遵守 Retry-After），其余状态码
+    直接失败。只有服务端故障（连接错误、超时、断流、408和5xx）计入熔断器，限速（429）
+    和请求本身的错误（其他4xx）不会触发熔断；熔断期间请求等待冷却结束后的试探结果。
+    等待熔断恢复和遵守429的 Retry-After 都不占用 max_retries 次数，但总共最多等到
+    request_deadline，仍未恢复才放弃。流在中途被截断时保留已收到的译文，重试时
+    只请求剩余部分。失败只记录日志、不弹窗，由调用方汇总后统一报告。传入 metrics 时
+    记录每次尝试的延迟和token数。
+
+    传输层只负责收发，按 next_action() 的指示循环：("wait", 秒数) 时等待，
+    ("send", 请求体) 时发送一次请求并依次调用 sending()、responded()、completed()
+    （请求出错时调用 failed()），("done", TranslationResult) 时返回结果。
+    须作为上下文管理器使用，保证因异常或取消中途退出时交还熔断器的试探资格。
+    """
+    def __init__(self, text, target_language, instruction=None, metrics=None):
+        self.settings = _retry_settings()
+        self.url, self.headers, self.payload, self.prompt_tokens = _translation_request(
+            text, target_language, instruction)
+        # 速率限制按 输入 + 最大输出 token 计费
+        self.request_tokens = self.prompt_tokens + self.payload["max_tokens"]
+        self.metrics = metrics
+        self.breaker = get_circuit_breaker()
+        self.attempt = 0
+        self.failures = 0    # 计入 max_retries 的失败次数（不含429）
+        self.partial = ""
+        self.error = self.status = None
+        self.delay = None
+        self.result = None
+        self.parser = None
+        self.probe = False    # 当前尝试是否是熔断器冷却后放行的试探请求
+        self.wait_deadline = time.monotonic() + self.settings["request_deadline"]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.probe:
+            self.probe = False
+            self.breaker.release()
+        return False
+
+    def next_action(self):
+        if self.result is not None:
+            return "done", self.result
+        if self.delay is not None:
+            delay, self.delay = self.delay, None
+            return "wait", delay
+        permit = self.breaker.allow()
+        if not permit:
+            wait = self.breaker.retry_in()
+            if time.monotonic() + wait > self.wait_deadline:
+                return "done", self._finish(self.error or "翻译服务熔断中，暂不发送请求")
+            return "wait", wait
+        self.probe = permit == "probe"
+        self.attempt += 1
+        self.status = self.retry_after = self.first_byte = None
+        self.parser = SSEParser()
+        self.started = time.perf_counter()
+        return "send", _continuation_payload(self.payload, self.partial)
+
+    def sending(self):
+        """速率限制放行、即将发出请求时调用；返回流式响应的截止时间（monotonic）"""
+        if self.metrics is not None:
+            self.metrics.add_rate_limit_wait(time.perf_counter() - self.started)
+        self.started = time.perf_counter()
+        return time.monotonic() + self.settings["request_deadline"]
+
+    def responded(self, status, retry_after=None):
+        """收到响应头时调用"""
+        self.first_byte = time.perf_counter() - self.started
+        self.status = status
+        self.retry_after = retry_after
+
+    def completed(self):
+        """响应（包括成功时的整个流）读取完毕后调用"""
+        parser = self.parser
+        if self.status == 200:
+            if parser.complete:
+                self.probe = False
+                self.breaker.record_success()
+                self._record_call(parser.usage.get("prompt_tokens", self.prompt_tokens),
+                                  parser.usage.get("completion_tokens", estimate_tokens(parser.text)))
+                self.result = TranslationResult(text=self.partial + parser.text, status=self.status,
+                                                attempts=self.attempt)
+                return
+            self._retry("翻译流在中途被截断", "StreamInterrupted")
+            return
+        error = f"翻译请求失败，状态码：{self.status}"
+        if self.status not in RETRYABLE_STATUS:
+            self._settle_breaker()
+            self._record_call(self.prompt_tokens, 0)
+            logging.error(error)
+            self._finish(error)
+            return
+        self._retry(error)
+
+    def failed(self, exc):
+        """连接错误、超时或流读取超过总时限时调用"""
+        self.status = None
+        self._retry(f"翻译请求出错（{type(exc).__name__}）：{exc}", type(exc).__name__)
+
+    def _retry(self, error, error_kind=None):
+        self.error = error
+        if self.parser.parts:
+            self.partial += self.parser.text
+            logging.warning(f"{error}，保留已收到的 {len(self.partial)} 个字符，重试时只请求剩余译文")
+        self._record_call(self.prompt_tokens, estimate_tokens(self.parser.text) if self.parser.parts else 0,
+                          error=error_kind)
+        self._settle_breaker()
+        max_retries = self.settings["max_retries"]
+        delay = _retry_delay(self.attempt - 1, self.retry_after, self.settings)
+        if self.status == 429 and time.monotonic() + delay <= self.wait_deadline:
+            # 被限速说明服务正常，按 Retry-After 等待即可，不消耗重试次数
+            self.delay = delay
+            logging.warning(f"{error}，{delay:.1f} 秒后重试")
+            return
+        self.failures += 1
+        if self.failures >= max_retries:
+            logging.error(f"{error}，已重试 {max_retries} 次")
+            self._finish(error)
+            return
+        self.delay = delay
+        logging.warning(f"{error}，{delay:.1f} 秒后重试 ({self.failures}/{max_retries})")
+
+    def _settle_breaker(self):
+        """把失败的尝试计入熔断器：只有服务端故障才算失败，否则只交还试探资格"""
+        probe, self.probe = self.probe, False
+        if self.status is None or self.status == 200 or self.status == 408 or self.status >= 500:
+            self.breaker.record_failure()
+        elif probe:
+            self.breaker.release()
+
+    def _record_call(self, tokens_sent, tokens_received, error=None):
+        if self.metrics is not None:
+            self.metrics.record_api_call(time.perf_counter() - self.started, self.status, tokens_sent,
+                                         tokens_received, first_byte=self.first_byte, error=error)
+
+    def _finish(self, error):
+        self.result = TranslationResult(error=error, status=self.status, attempts=self.attempt)
+        return self.result
+
+def _request_translation(text, target_language, instruction=None, metrics=None):
+    """用共享的keep-alive会话发送流式翻译请求，返回 TranslationResult；重试规则见 TranslationAttempts"""
+    import requests
+    try:
+        with TranslationAttempts(text, target_language, instruction, metrics) as attempts:
+            session = get_http_session()
+            timeout = (attempts.settings["connect_timeout"], attempts.settings["read_timeout"])
+            while True:
+                action, value = attempts.next_action()
+                if action == "done":
+                    return value
+                if action == "wait":
+                    time.sleep(value)
+                    continue
+                try:
+                    get_rate_limiter().acquire(attempts.request_tokens)
+                    deadline = attempts.sending()
+                    with session.post(attempts.url, headers=attempts.headers, json=value,
+                                      stream=True, timeout=timeout) as response:
+                        attempts.responded(response.status_code, retry_after_seconds(response))
+                        if response.status_code == 200:
+                            _read_translation_stream(response, deadline, attempts.parser)
+                    attempts.completed()
+                except (requests.exceptions.Timeout, requests.exceptions.ConnectionError,
+                        requests.exceptions.ChunkedEncodingError, RequestDeadlineExceeded) as e:
+                    attempts.failed(e)
     except Exception as e:
-        messagebox.showerror("错误", f"翻译过程中出错: {str(e)}")
-        logging.error(f"翻译过程中出错: {str(e)}")
+        logging.error(f"翻译过程中出错: {e}")
+        return TranslationResult(error=f"翻译过程中出错: {e}")
+
+class AsyncTranslationClient:
+    """基于asyncio和aiohttp的翻译客户端。
+
+    在独立线程中运行一个事件循环，所有流式请求共用一个aiohttp会话，由信号量限制
+    同时在途的流数量（translation_settings.max_streams），因此数百个并发翻译也只
+    占用一个线程。重试、熔断、限速和截断续译与 _request_translation 共用 TranslationAttempts。
+    其他线程通过 submit() 提交协程并得到 concurrent.futures.Future，取消该Future
+    会取消对应的请求并关闭连接。
+    """
+    def __init__(self, max_streams=64):
+        import asyncio
+        self.max_streams = max_streams
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="translate-async", daemon=True)
+        self.thread.start()
+        self.submit(self._start()).result()
+
+    async def _start(self):
+        import asyncio
+        import aiohttp
+        self.semaphore = asyncio.Semaphore(self.max_streams)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_streams, limit_per_host=self.max_streams)
+        )
+
+    def submit(self, coroutine):
+        import asyncio
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    async def translate_batch(self, segments, target_language, metrics=None):
+        """_translate_batch 的协程版本，同一组请求并发发送"""
+        import asyncio
+        steps = _batch_requests(segments, target_language)
+        results = None
+        try:
+            while True:
+                batch = steps.send(results)
+                results = list(await asyncio.gather(*(
+                    self.request(text, target_language, instruction=instruction, metrics=metrics)
+                    for text, instruction in batch)))
+        except StopIteration as done:
+            return done.value
+
+    async def request(self, text, target_language, instruction=None, metrics=None):
+        """_request_translation 的协程版本，返回 TranslationResult"""
+        import asyncio
+        import aiohttp
+        try:
+            with TranslationAttempts(text, target_language, instruction, metrics) as attempts:
+                settings = attempts.settings
+                timeout = aiohttp.ClientTimeout(total=settings["request_deadline"],
+                                                sock_connect=settings["connect_timeout"],
+                                                sock_read=settings["read_timeout"])
+                while True:
+                    action, value = attempts.next_action()
+                    if action == "done":
+                        return value
+                    if action == "wait":
+                        await asyncio.sleep(value)
+                        continue
+                    try:
+                        await get_rate_limiter().acquire_async(attempts.request_tokens)
+                        async with self.semaphore:
+                            attempts.sending()
+                            async with self.session.post(attempts.url, headers=attempts.headers,
+                                                         json=value, timeout=timeout) as response:
+                                attempts.responded(response.status, retry_after_seconds(response))
+                                if response.status == 200:
+                                    async for chunk in response.content.iter_any():
+                                        attempts.parser.feed(chunk)
+                                    attempts.parser.close()
+                        attempts.completed()
+                    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                        attempts.failed(e)
+        except Exception as e:
+            logging.error(f"翻译过程中出错: {e}")
+            return TranslationResult(error=f"翻译过程中出错: {e}")
+
+    def close(self):
+        """取消所有未完成的请求，关闭会话并停止事件循环"""
+        import asyncio
+
+        async def shutdown():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.session.close()
+
+        self.submit(shutdown()).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+def translate_pages(texts, target_language, metrics=None):
+    """翻译多页文本，短页面合并进同一个请求、长页面按token预算切分；返回每页的 (译文, 失败块数)"""
+    page_chunks = [split_text_into_chunks(text) for text in texts]
+    translated = translate_segments([chunk for chunks in page_chunks for chunk in chunks], target_language,
+                                    metrics=metrics)
+    results = []
+    position = 0
+    for chunks in page_chunks:
+        parts = translated[position:position + len(chunks)]
+        position += len(chunks)
+        failed = sum(1 for part in parts if not part.ok)
+        results.append(("\n".join(part.text if part.ok else "（翻译失败）" for part in parts), failed))
+    errors = {}
+    for result in translated:
+        if not result.ok:
+            errors[result.error] = errors.get(result.error, 0) + 1
+    for error, count in errors.items():
+        logging.error(f"{count} 段翻译失败：{error}")
+    return results
+
+def get_pdf_page_count(pdf_path):
+    """读取PDF总页数（不渲染页面）"""
+    from pdf2image import pdfinfo_from_path
+    info = pdfinfo_from_path(pdf_path, poppler_path=get_settings('poppler_config').get('path'))
+    return int(info["Pages"])
+
+def extract_text_layer(pdf_path):
+    """用poppler的pdftotext一次性提取所有页面的嵌入文本，返回 {页码: 文本}；pdftotext不可用时返回空字典"""
+    poppler_path = get_settings('poppler_config').get('path')
+    executable = os.path.join(poppler_path, 'pdftotext') if poppler_path else 'pdftotext'
+    try:
+        result = subprocess.run(
+            [executable, '-enc', 'UTF-8', pdf_path, '-'],
+            capture_output=True,
+            timeout=get_settings('ocr_settings').get('text_layer_timeout', 120)
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logging.warning(f"提取嵌入文本失败，全部页面改用OCR: {str(e)}")
+        return {}
+    if result.returncode != 0:
+        logging.warning(f"pdftotext 返回 {result.returncode}，全部页面改用OCR: "
+                        f"{result.stderr.decode('utf-8', errors='replace').strip()}")
+        return {}
+    # pdftotext 在每页末尾输出换页符
+    pages = result.stdout.decode('utf-8', errors='replace').split('\f')
+    return {number: text for number, text in enumerate(pages, 1) if text.strip()}
+
+def usable_text_layer(text, min_chars=None):
+    """判断嵌入文本是否可直接使用：有效字符足够多，且不是字体编码损坏产生的乱码"""
+    if not text:
+        return None
+    if min_chars is None:
+        min_chars = get_settings('ocr_settings').get('text_layer_min_chars', 20)
+    lines = [" ".join(line.split()) for line in text.splitlines()]
+    text = "\n".join(line for line in lines if line)
+    visible = [c for c in text if not c.isspace()]
+    readable = sum(1 for c in visible if c.isalnum() or c in ".,;:!?()[]%'\"-+=/。，；：！？（）、《》“”")
+    if readable < min_chars or readable < 0.8 * len(visible):
+        return None
+    return text
+
+def page_windows(page_numbers, page_window):
+    """把页码序列切分为连续的 (first_page, last_page) 窗口，每个窗口不超过 page_window 页"""
+    first_page = last_page = None
+    for number in sorted(page_numbers):
+        if first_page is not None and number == last_page + 1 and number - first_page < page_window:
+            last_page = number
+            continue
+        if first_page is not None:
+            yield first_page, last_page
+        first_page = last_page = number
+    if first_page is not None:
+        yield first_page, last_page
+
+def iter_pdf_pages(pdf_path, dpi=None, page_window=None, page_numbers=None):
+    """按页窗口流式渲染PDF，内存中最多只保留 page_window 页图片；page_numbers 指定只渲染哪些页"""
+    from pdf2image import convert_from_path
+    settings = get_settings('ocr_settings')
+    dpi = dpi or settings['dpi']
+    page_window = max(1, page_window or settings.get('page_window', 8))
+    if page_numbers is None:
+        page_numbers = range(1, get_pdf_page_count(pdf_path) + 1)
+    for first_page, last_page in page_windows(page_numbers, page_window):
+        images = convert_from_path(
+            pdf_path,
+            dpi=dpi,
+            first_page=first_page,
+            last_page=last_page,
+            poppler_path=get_settings('poppler_config').get('path')
+        )
+        for offset, image in enumerate(images):
+            yield first_page + offset, image
+        del images
+
+def binomial_blur(gray, radius=2):
+    """可分离的二项式模糊（近似高斯），适合8位灰度图。
+
+    2*radius 阶二项式核等于 2*radius 次相邻两像素相加，每个方向在两个uint16缓冲区
+    之间交替累加（正反方向交替以保持居中，边缘复制边界像素），不做填充拷贝，
+    每次只有一次整幅加法。radius<=4 时累加和不超过 255*256，不会溢出uint16。
+    """
+    import numpy as np
+    radius = max(1, min(radius, 4))
+    src = gray.astype(np.uint16)
+    dst = np.empty_like(src)
+    for axis in (0, 1):
+        def part(start, stop):
+            return (slice(start, stop),) if axis == 0 else (slice(None), slice(start, stop))
+        for step in range(2 * radius):
+            if step % 2 == 0:
+                np.add(src[part(None, -1)], src[part(1, None)], out=dst[part(None, -1)])
+                np.add(src[part(-1, None)], src[part(-1, None)], out=dst[part(-1, None)])
+            else:
+                np.add(src[part(1, None)], src[part(None, -1)], out=dst[part(1, None)])
+                np.add(src[part(None, 1)], src[part(None, 1)], out=dst[part(None, 1)])
+            src, dst = dst, src
+        src >>= 2 * radius
+    return src
+
+def luminance(array):
+    """RGB → 8位灰度（ITU-R 601权重的整数近似）"""
+    import numpy as np
+    if array.ndim == 2:
+        return array
+    # 先转为uint16再乘：NumPy 1.x 按数值决定标量类型，uint8数组乘uint16标量仍是uint8，会静默溢出
+    weighted = array[..., 0].astype(np.uint16) * 77
+    weighted += array[..., 1].astype(np.uint16) * 150
+    weighted += array[..., 2].astype(np.uint16) * 29
+    return (weighted >> 8).astype(np.uint8)
+
+def otsu_threshold(gray):
+    """大津法阈值：使类间方差最大的灰度值"""
+    import numpy as np
+    histogram = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    weights = np.cumsum(histogram)
+    means = np.cumsum(histogram * np.arange(256))
+    total_weight, total_mean = weights[-1], means[-1]
+    background = weights[:-1]
+    foreground = total_weight - background
+    valid = (background > 0) & (foreground > 0)
+    between = np.zeros(255)
+    between[valid] = (total_mean * background[valid] - means[:-1][valid] * total_weight) ** 2 / (
+        background[valid] * foreground[valid])
+    return int(np.argmax(between))
+
+def sharpen_luma(gray, amount=0.5, radius=2):
+    """在8位亮度通道上做反锐化掩模：gray + amount * (gray - 模糊)，返回uint8数组"""
+    import numpy as np
+    detail = np.subtract(gray, binomial_blur(gray, radius), dtype=np.int16)
+    detail *= np.int16(round(amount * 16))
+    detail >>= 4
+    detail += gray
+    np.clip(detail, 0, 255, out=detail)
+    return detail.astype(np.uint8)
+
+def contrast_lut(gray, min_span=64):
+    """把亮度的1%/99%百分位拉伸到0~255的查找表；百分位间距小于 min_span 时返回None。
+
+    墨迹不足1%的稀疏页面（标题页、章节页）上两个百分位都落在纸张的噪声范围内，
+    拉伸只会把底色噪声放大成大片灰黑斑点，因此间距太小时不拉伸。
+    """
+    import numpy as np
+    # 在降采样后的像素上估计百分位，避免对整页排序
+    low, high = np.percentile(gray[::4, ::4], (1, 99))
+    if high - low < max(1, min_span):
+        return None
+    lut = np.arange(256, dtype=np.float32)
+    return np.clip(np.rint((lut - low) * (255.0 / (high - low))), 0, 255).astype(np.uint8)
+
+def _enhance(image, sharpen=0.5, radius=2, contrast=True, binarize=False, contrast_min_span=64):
+    """增强PIL页面图像：只处理亮度通道，彩色页面保留色度。
+
+    RGB页面由PIL转为YCbCr后取Y通道（与各通道加同一细节等价，但运算量只有三分之一），
+    在NumPy中做反锐化掩模，对比度拉伸和二值化阈值通过PIL的查找表完成，最后合并回RGB。
+    binarize=True 时输出大津法二值化后的灰度图。
+    """
+    import numpy as np
+    from PIL import Image
+    if image.mode not in ('L', 'RGB'):
+        image = image.convert('RGB')
+    if image.mode == 'L' or binarize:
+        luma, chroma = image.convert('L'), None
+    else:
+        luma, *chroma = image.convert('YCbCr').split()
+    gray = np.asarray(luma)
+    if sharpen > 0:
+        gray = sharpen_luma(gray, sharpen, radius)
+    lut = contrast_lut(gray, contrast_min_span) if contrast else None
+    if binarize:
+        if lut is not None:
+            gray = lut[gray]
+        threshold = otsu_threshold(gray)
+        lut = np.where(np.arange(256) > threshold, 255, 0).astype(np.uint8)
+    luma = Image.fromarray(gray)
+    if lut is not None:
+        luma = luma.point(lut.tolist())
+    if chroma is None:
+        return luma
+    return Image.merge('YCbCr', (luma, *chroma)).convert('RGB')
+
+def enhance_array(array, sharpen=0.5, radius=2, contrast=True, binarize=False, contrast_min_span=64):
+    """_enhance 的数组版本，输入输出均为uint8数组（HxW 或 HxWx3）"""
+    import numpy as np
+    from PIL import Image
+    return np.asarray(_enhance(Image.fromarray(array), sharpen, radius, contrast, binarize, contrast_min_span))
+
+def enhance_image(image, options=None):
+    """按 enhance_settings 增强PIL页面图像，返回新的PIL图像"""
+    options = dict(get_settings('enhance_settings'), **(options or {}))
+    return _enhance(
+        image,
+        sharpen=options.get('sharpen', 0.5),
+        radius=options.get('radius', 2),
+        contrast=options.get('contrast', True),
+        binarize=options.get('binarize', False),
+        contrast_min_span=options.get('contrast_min_span', 64)
+    )
+
+def encode_image(image, fmt='PNG', quality=None):
+    """把页面编码为插入文档用的内存缓冲区"""
+    buffer = io.BytesIO()
+    if fmt.upper() in ('JPEG', 'JPG'):
+        if image.mode not in ('L', 'RGB'):
+            image = image.convert('RGB')
+        image.save(buffer, 'JPEG', quality=quality or 80, optimize=True)
+    else:
+        image.save(buffer, fmt)
+    return buffer.getvalue()
+
+EMBED_FORMATS = {'JPEG': 'JPEG', 'JPG': 'JPEG', 'PNG': 'PNG'}    # 可嵌入Word文档的图片格式
+
+def encode_embed_image(image, width_inches):
+    """按文档中的显示宽度和 embed_settings.dpi 缩小页面后压缩编码，避免把300 DPI原图塞进docx"""
+    from PIL import Image
+    settings = get_settings('embed_settings')
+    # Word不支持WebP，GIF等格式在文档里也会被错误标注，只接受 JPEG 或 PNG
+    fmt = EMBED_FORMATS.get(str(settings.get('format', 'JPEG')).upper())
+    if fmt is None:
+        raise ConversionError(f"embed_settings.format 只支持 JPEG 或 PNG，当前为 {settings.get('format')!r}")
+    target_width = int(width_inches * settings.get('dpi', 150))
+    if 0 < target_width < image.width:
+        target_height = max(1, round(image.height * target_width / image.width))
+        image = image.resize((target_width, target_height), Image.LANCZOS)
+    return encode_image(image, fmt, settings.get('quality', 80))
+
+def estimate_line_height(image):
+    """用水平投影估计页面文本行高（像素）；没有找到文本行时返回None"""
+    import numpy as np
+    gray = luminance(np.asarray(image if image.mode in ('L', 'RGB') else image.convert('RGB')))
+    # 只按列降采样，保持行方向的分辨率
+    gray = gray[:, ::4]
+    # 大津法阈值属于暗类（与二值化的 > 阈值为白一致）
+    ink = gray <= otsu_threshold(gray)
+    rows = ink.mean(axis=1) > 0.005
+    # 连续的有墨迹行构成一个文本行
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], rows.astype(np.int8), [0]))))
+    heights = edges[1::2] - edges[::2]
+    # 忽略噪点和图片、表格等高度超过页面1/10的区域
+    heights = heights[(heights >= 3) & (heights <= gray.shape[0] / 10)]
+    if len(heights) == 0:
         return None
+    return float(np.median(heights))
+
+def prepare_ocr_image(image, dpi):
+    """按页面的字号自适应OCR分辨率：字足够大时把页面缩小到 target_line_px 行高（不低于 min_dpi），返回 (图像, 实际DPI)"""
+    from PIL import Image
+    settings = get_settings('ocr_settings')
+    min_dpi = min(settings.get('min_dpi', 150), dpi)
+    target_line_px = settings.get('target_line_px', 28)
+    line_height = estimate_line_height(image)
+    if line_height is None:
+        # 没有可识别的文本行（空白页或纯图片），用最低分辨率即可
+        scale = min_dpi / dpi
+    else:
+        scale = min(1.0, max(min_dpi / dpi, target_line_px / line_height))
+    if scale >= 0.95:
+        return image, dpi
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.BILINEAR), round(dpi * scale)
+
+class PageTask:
+    """流水线中单页的处理状态，页面图像全程保存在内存中"""
+    def __init__(self, number, image):
+        self.number = number
+        self.image = image         # 解码后的页面图像（PIL），OCR完成后释放
+        self.ocr_dpi = None        # 自适应后送入OCR的分辨率
+        self.image_bytes = None    # 按显示宽度缩小并压缩后的图片，直接写入文档
+        self.original_text = None
+        self.translated_text = None
+        self.text_source = None    # "text_layer"、"ocr" 或 None（识别失败）
+
+    @property
+    def title(self):
+        return f"幻灯片 {self.number:02d}"
+
+class JobManifest:
+    """转换任务的断点记录：以追加写入的JSON行保存每页的进度和中间结果。
+
+    第一行记录源PDF指纹和影响结果的选项，之后每行是一次页面状态变化
+    （ocr_done → translated）。重新运行同一任务时回放这些记录，已完成的页面
+    只重新渲染用于插图，不再重复OCR和调用翻译API；PDF或选项变化时自动从头开始。
+    """
+    STATES = ("ocr_done", "translated")
 
-def translate_text_in_chunks(text, target_language, delay=0.5):
-    chunks = split_text_into_chunks(text, max_length=1000)
-    translated_chunks = []
-    for i, chunk in enumerate(chunks, 1):
-        time.sleep(delay)
-        translated = translate_text(chunk, target_language)
-        if translated is None:
-            translated_chunks.append("（翻译失败）")
+    def __init__(self, path, pdf_path, options, resume=True):
+        self.path = path
+        self.lock = threading.Lock()
+        self.header = {"type": "job", "version": 1, "pdf": os.path.abspath(pdf_path),
+                       "fingerprint": file_fingerprint(pdf_path), "options": options}
+        self.pages = {}
+        if resume and os.path.exists(path):
+            self._load()
+        if not self.pages:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(self.header, ensure_ascii=False) + "\n")
+
+    def _load(self):
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        records = []
+        valid_end = 0
+        for line in data.splitlines(keepends=True):
+            # 崩溃时可能留下写了一半（或缺少换行符）的最后一行，只回放到最后一个完整的行
+            if not line.endswith(b"\n"):
+                break
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+            valid_end += len(line)
+        if not records or records[0] != self.header:
+            logging.info("源文件或转换选项已变化，忽略旧的断点记录")
+            return
+        if valid_end < len(data):
+            # 截掉残缺的行，否则之后追加的记录会接在残片后面而无法解析
+            logging.info(f"断点记录末尾不完整，已截断到第 {len(records)} 行")
+            with open(self.path, 'r+b') as f:
+                f.truncate(valid_end)
+        for record in records[1:]:
+            self.pages.setdefault(record["page"], {}).update(record)
+
+    def record(self, page_number, state, **fields):
+        entry = dict(fields, type="page", page=page_number, state=state)
+        with self.lock:
+            self.pages.setdefault(page_number, {}).update(entry)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def state(self, page_number):
+        return self.pages.get(page_number, {}).get("state")
+
+    def reached(self, page_number, state):
+        current = self.state(page_number)
+        return current is not None and self.STATES.index(current) >= self.STATES.index(state)
+
+    def restore(self, task):
+        """把断点记录中的中间结果写回页面任务"""
+        page = self.pages.get(task.number, {})
+        if self.reached(task.number, "ocr_done"):
+            task.original_text = page.get("original_text")
+            task.text_source = page.get("text_source")
+        if self.reached(task.number, "translated"):
+            task.translated_text = page.get("translated_text")
+        return task
+
+def file_fingerprint(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return {"size": os.path.getsize(path), "sha256": digest.hexdigest()}
+
+def peak_rss_mb():
+    """当前进程的内存峰值（MB）；没有 resource 模块的平台（Windows）返回None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以KB为单位，macOS 以字节为单位
+    return round(peak / (1 << 20 if sys.platform == 'darwin' else 1 << 10), 1)
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+def _cache_stats():
+    # 只读取已经打开的缓存：统计本身不应在 ~/.pdfToDoc 下创建缓存数据库
+    stats = {}
+    for name, cache in (("translation", _translation_cache), ("ocr", _ocr_cache)):
+        if cache is not None:
+            stats[name] = cache.stats()
+    return stats
+
+def _enable_profile(profile):
+    """开始剖析；Python 3.12 起同一时间只能有一个剖析器，已被占用时返回False"""
+    try:
+        profile.enable()
+        return True
+    except ValueError:
+        return False
+
+class RunMetrics:
+    """单次转换的性能统计：各阶段每页的墙钟与CPU时间、翻译API的延迟和token数、
+    缓存命中率以及内存峰值。线程安全，流水线各阶段和翻译线程池共用同一个实例。
+
+    CPU时间按线程统计（time.thread_time），OCR子进程和pdftoppm等外部进程的CPU
+    不计入；缓存命中数取运行前后的差值，并行转换多个文档时会互相包含。
+    """
+    LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 30, 60)
+
+    def __init__(self, profile=False):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.started_cpu = time.process_time()
+        self.timings = []       # (阶段, 页码, 墙钟秒数, CPU秒数)
+        self.api_calls = []     # 每次API请求尝试一条记录
+        self.rate_limit_wait = 0.0
+        self.cache_start = _cache_stats()
+        self.profile = None
+        if profile:
+            import cProfile
+            self.profile = cProfile.Profile()
+        self.thread_profiles = []
+
+    def add_timing(self, stage, page, wall, cpu):
+        with self.lock:
+            self.timings.append((stage, page, wall, cpu))
+
+    @contextmanager
+    def stage(self, name, page=None):
+        """统计 with 块内的耗时，记为 name 阶段处理 page 页的时间"""
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self.add_timing(name, page, time.perf_counter() - wall, time.thread_time() - cpu)
+
+    def record_api_call(self, latency, status, tokens_sent, tokens_received, first_byte=None, error=None):
+        with self.lock:
+            self.api_calls.append({
+                "latency": latency, "first_byte": first_byte, "status": status,
+                "tokens_sent": tokens_sent, "tokens_received": tokens_received, "error": error
+            })
+
+    def add_rate_limit_wait(self, seconds):
+        with self.lock:
+            self.rate_limit_wait += seconds
+
+    def profiled(self, func):
+        """开启性能剖析时，让 func 在线程内单独剖析，线程结束后合并结果；否则原样返回"""
+        if self.profile is None:
+            return func
+        import cProfile
+
+        def run(*args, **kwargs):
+            profile = cProfile.Profile()
+            if not _enable_profile(profile):
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+                with self.lock:
+                    self.thread_profiles.append(profile)
+        return run
+
+    def _latency_histogram(self, latencies):
+        histogram = {f"<={bound}s": 0 for bound in self.LATENCY_BUCKETS}
+        histogram[f">{self.LATENCY_BUCKETS[-1]}s"] = 0
+        for latency in latencies:
+            for bound in self.LATENCY_BUCKETS:
+                if latency <= bound:
+                    histogram[f"<={bound}s"] += 1
+                    break
+            else:
+                histogram[f">{self.LATENCY_BUCKETS[-1]}s"] += 1
+        return histogram
+
+    def report(self, **extra):
+        """汇总为可直接序列化为JSON的字典，extra 中的字段原样写在最前面"""
+        with self.lock:
+            timings = list(self.timings)
+            api_calls = list(self.api_calls)
+            rate_limit_wait = self.rate_limit_wait
+        wall = time.perf_counter() - self.started
+        stages = {}
+        for stage, page, stage_wall, stage_cpu in timings:
+            stages.setdefault(stage, {"walls": [], "cpu": 0.0})
+            stages[stage]["walls"].append(stage_wall)
+            stages[stage]["cpu"] += stage_cpu
+        stage_summary = {}
+        for stage, values in stages.items():
+            walls = values["walls"]
+            stage_summary[stage] = {
+                "count": len(walls),
+                "wall_total": round(sum(walls), 4),
+                "wall_mean": round(sum(walls) / len(walls), 4),
+                "wall_p50": round(_percentile(walls, 0.5), 4),
+                "wall_p95": round(_percentile(walls, 0.95), 4),
+                "wall_max": round(max(walls), 4),
+                "cpu_total": round(values["cpu"], 4)
+            }
+        latencies = [call["latency"] for call in api_calls]
+        statuses = {}
+        for call in api_calls:
+            key = str(call["status"] if call["status"] is not None else call["error"])
+            statuses[key] = statuses.get(key, 0) + 1
+        cache_end = _cache_stats()
+        cache = {}
+        for name, stats in cache_end.items():
+            start = self.cache_start.get(name, {"hits": 0, "misses": 0})
+            hits = stats["hits"] - start["hits"]
+            misses = stats["misses"] - start["misses"]
+            cache[name] = {"hits": hits, "misses": misses,
+                           "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0}
+        pages = {page for _, page, _, _ in timings if page is not None}
+        report = dict(extra)
+        report.update({
+            "wall_seconds": round(wall, 3),
+            "cpu_seconds": round(time.process_time() - self.started_cpu, 3),
+            "pages": len(pages),
+            "pages_per_second": round(len(pages) / wall, 4) if wall else None,
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": stage_summary,
+            "api": {
+                "requests": len(api_calls),
+                "failures": sum(1 for call in api_calls if call["status"] != 200),
+                "statuses": statuses,
+                "tokens_sent": sum(call["tokens_sent"] for call in api_calls),
+                "tokens_received": sum(call["tokens_received"] for call in api_calls),
+                "rate_limit_wait_seconds": round(rate_limit_wait, 3),
+                "latency_p50": round(_percentile(latencies, 0.5), 4) if latencies else None,
+                "latency_p95": round(_percentile(latencies, 0.95), 4) if latencies else None,
+                "latency_max": round(max(latencies), 4) if latencies else None,
+                "latency_histogram": self._latency_histogram(latencies)
+            },
+            "cache": cache,
+            "timings": [{"stage": stage, "page": page, "wall": round(stage_wall, 6), "cpu": round(stage_cpu, 6)}
+                        for stage, page, stage_wall, stage_cpu in timings]
+        })
+        return report
+
+    def write(self, path, report):
+        """按扩展名写出报告：.csv 写每个阶段每页一行的明细，其他写完整的JSON"""
+        if path.lower().endswith('.csv'):
+            import csv
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=["stage", "page", "wall", "cpu"])
+                writer.writeheader()
+                writer.writerows(report["timings"])
         else:
-            translated_chunks.append(translated)
-        logging.info(f"第 {i} 块翻译完成，共 {len(chunks)} 块")
-    return "\n".join(translated_chunks)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+    def write_profile(self, path):
+        """合并各线程的剖析结果写成 pstats 文件，可用 `python -m pstats` 或 snakeviz 查看"""
+        if self.profile is None:
+            return None
+        import pstats
+        stats = pstats.Stats(self.profile)
+        for profile in self.thread_profiles:
+            stats.add(profile)
+        stats.dump_stats(path)
+        return stats
+
+def log_run_report(report):
+    """把运行报告中各阶段的耗时汇总写入日志"""
+    for stage, summary in sorted(report["stages"].items(), key=lambda item: -item[1]["wall_total"]):
+        logging.info(f"阶段 {stage}: {summary['count']} 次，共 {summary['wall_total']:.2f} 秒，"
+                     f"平均 {summary['wall_mean']:.3f} 秒，p95 {summary['wall_p95']:.3f} 秒")
+    api = report["api"]
+    if api["requests"]:
+        logging.info(f"翻译API: {api['requests']} 次请求（失败 {api['failures']} 次），延迟 p50 "
+                     f"{api['latency_p50']:.2f} 秒、p95 {api['latency_p95']:.2f} 秒，发送约 "
+                     f"{api['tokens_sent']} token，接收约 {api['tokens_received']} token")
+    logging.info(f"总耗时 {report['wall_seconds']:.1f} 秒，{report['pages_per_second'] or 0:.2f} 页/秒，"
+                 f"内存峰值 {report['peak_rss_mb']} MB")
+
+_STAGE_DONE = object()
+
+class StagedPipeline:
+    """多阶段流水线：阶段之间用有界队列连接，每个阶段可配置并发线程数。
+
+    阶段定义为 (名称, 函数, 线程数) 或 (名称, 函数, 线程数, 批量大小, 等待秒数)；后者的
+    函数一次接收最多 批量大小 个项目组成的列表（最多等待指定秒数凑批），并返回结果列表。
+
+    下游处理慢时上游会阻塞在队列上（背压），因此同时在途的页面数最多为
+    各队列容量与各阶段线程数之和，与文档页数无关。run() 按完成顺序产出结果，
+    由调用方按页序重排。传入 metrics 并开启剖析时，各阶段线程分别剖析后合并。
+    """
+    def __init__(self, source, stages, queue_size=4, metrics=None):
+        self.source = source
+        self.metrics = metrics
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in range(len(stages) + 1)]
+        self.stop_event = threading.Event()
+        self.error = None
+        self.lock = threading.Lock()
+        self.threads = []
+
+    def _put(self, q, item):
+        while not self.stop_event.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fail(self, e):
+        with self.lock:
+            if self.error is None:
+                self.error = e
+        self.stop_event.set()
+
+    def _run_source(self):
+        try:
+            for item in self.source:
+                if not self._put(self.queues[0], item):
+                    break
+        except Exception as e:
+            logging.error(f"流水线输入阶段出错: {str(e)}")
+            self._fail(e)
+        finally:
+            self._put(self.queues[0], _STAGE_DONE)
+
+    def _run_stage(self, index, name, func, remaining, batch_size, batch_wait):
+        in_queue, out_queue = self.queues[index], self.queues[index + 1]
+        while True:
+            try:
+                item = in_queue.get(timeout=0.1)
+            except queue.Empty:
+                if self.stop_event.is_set():
+                    return
+                continue
+            if item is _STAGE_DONE:
+                # 让同阶段的其他线程也看到结束标记，最后一个退出的线程通知下游
+                in_queue.put(item)
+                with self.lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    self._put(out_queue, _STAGE_DONE)
+                return
+            if self.stop_event.is_set():
+                continue
+            if batch_size:
+                # 批量阶段：在 batch_wait 秒内尽量凑满一批，上游结束时立即处理已有项目
+                items = [item]
+                deadline = time.monotonic() + batch_wait
+                while len(items) < batch_size:
+                    try:
+                        extra = in_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if extra is _STAGE_DONE:
+                        in_queue.put(extra)
+                        break
+                    items.append(extra)
+            try:
+                results = func(items) if batch_size else [func(item)]
+            except Exception as e:
+                logging.error(f"流水线阶段 {name} 出错: {str(e)}")
+                self._fail(e)
+                continue
+            for result in results:
+                self._put(out_queue, result)
+
+    def run(self):
+        """启动所有阶段并逐个产出最后一个阶段的结果；任一阶段出错时停止流水线并抛出该异常"""
+        wrap = self.metrics.profiled if self.metrics is not None else (lambda func: func)
+        source_thread = threading.Thread(target=wrap(self._run_source), name="pipeline-source", daemon=True)
+        self.threads.append(source_thread)
+        for index, (name, func, workers, *batch) in enumerate(self.stages):
+            workers = max(1, workers)
+            batch_size, batch_wait = (list(batch) + [None, 0.0])[:2]
+            remaining = [workers]
+            for n in range(workers):
+                self.threads.append(threading.Thread(
+                    target=wrap(self._run_stage),
+                    args=(index, name, func, remaining, batch_size, batch_wait),
+                    name=f"pipeline-{name}-{n}",
+                    daemon=True
+                ))
+        for thread in self.threads:
+            thread.start()
+        out_queue = self.queues[-1]
+        try:
+            while True:
+                try:
+                    item = out_queue.get(timeout=0.1)
+                except queue.Empty:
+                    if self.stop_event.is_set():
+                        break
+                    continue
+                if item is _STAGE_DONE:
+                    break
+                yield item
+        finally:
+            self.stop_event.set()
+            for thread in self.threads:
+                thread.join()
+        if self.error is not None:
+            raise self.error
+
+class ConversionError(Exception):
+    """转换流程中无法继续的错误"""
+
+class PartialConversionError(ConversionError):
+    """文档已经写出，但有页面OCR或翻译失败；failed_pages 为 {页码: "ocr" 或 "translate"}"""
+    def __init__(self, output_file, failed_pages):
+        self.output_file = output_file
+        self.failed_pages = failed_pages
+        details = "；".join(
+            f"{label}：第 {', '.join(str(n) for n in sorted(failed_pages) if failed_pages[n] == stage)} 页"
+            for stage, label in (("ocr", "OCR失败"), ("translate", "翻译失败"))
+            if stage in failed_pages.values()
+        )
+        super().__init__(f"共 {len(failed_pages)} 页处理失败（{details}），文档已生成：{output_file}。"
+                         f"重新运行同一命令可只补做这些页面")
+
+IMAGE_WIDTHS = {'1': 4, '2': 6, '3': 8}    # 图片大小选项 → 插入文档时的宽度（英寸）
+
+def default_output_path(pdf_path, output_dir=None):
+    return os.path.join(
+        output_dir or os.path.dirname(os.path.abspath(pdf_path)),
+        f"{os.path.basename(pdf_path)}_转换结果.docx"
+    )
+
+def convert_pdf(pdf_path, output_file=None, target_language='ch', img_width=6,
+                enhance=False, keep_images=False, use_text_layer=None, resume=True, progress=None,
+                report=None, profile=None, volume_pages=None):
+    """把PDF转换为带OCR原文和译文的Word文档，返回输出文件路径。
 
-def pdf_to_images(pdf_path, output_folder):
+    不依赖任何界面：进度通过 progress(message, percent) 回调报告，失败时抛出异常。
+    有页面OCR或翻译失败时文档照常写出（失败处留空或标注“翻译失败”），随后抛出
+    PartialConversionError，运行报告的 status 为 "partial"。
+    页面图像只在内存中流转，仅在 keep_images=True 时写入磁盘。中途失败时会保留断点
+    记录，resume=True 时再次运行会复用已完成页面的OCR和翻译结果。
+
+    report 为 "json" 或 "csv" 时在输出文档旁写出运行报告 <输出文档>.report.<格式>，
+    profile=True 时写出剖析结果 <输出文档>.prof；两者默认取 report_settings 配置。
+    volume_pages 大于0时每隔这么多页分卷输出（默认取 docx_settings.volume_pages），
+    各卷命名见 volume_path，返回值仍为 output_file。
+    """
+    progress = progress or (lambda message, value=None: None)
+    output_file = output_file or default_output_path(pdf_path)
+    report_settings = get_settings('report_settings')
+    report = report if report is not None else report_settings.get('format')
+    profile = profile if profile is not None else report_settings.get('profile', False)
+    if volume_pages is None:
+        volume_pages = get_settings('docx_settings').get('volume_pages', 0)
+    metrics = RunMetrics(profile=profile)
+    profiling = metrics.profile is not None and _enable_profile(metrics.profile)
+    status = "failed"
+    total_pages = None
+    volumes = []
+    failed_pages = {}
     try:
-        images = convert_from_path(
-            pdf_path, 
-            dpi=config['ocr_settings']['dpi'],
-            poppler_path=config['poppler_config']['path']
+        output_dir = os.path.dirname(os.path.abspath(output_file))
+        # 每个文档使用独立的图片目录，批量并行转换同一目录下的多个PDF时互不干扰
+        image_folder = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(output_file))[0]}_images")
+        if keep_images and not os.path.exists(image_folder):
+            os.makedirs(image_folder)
+        progress("正在转换PDF为图片...", 0)
+        total_pages = get_pdf_page_count(pdf_path)
+        if total_pages == 0:
+            raise ConversionError(f"PDF中没有页面: {pdf_path}")
+        settings = get_settings('pipeline_settings')
+        ocr_pool = get_ocr_pool()
+        if use_text_layer is None:
+            use_text_layer = get_settings('ocr_settings').get('use_text_layer', True)
+        # 原生数字PDF的页面直接使用嵌入文本，只有扫描页或纯图片页才需要OCR
+        with metrics.stage("text_layer_extract"):
+            text_layer = extract_text_layer(pdf_path) if use_text_layer else {}
+        manifest_path = f"{output_file}.job.jsonl"
+        manifest = JobManifest(
+            manifest_path,
+            pdf_path,
+            {"target_language": target_language,
+             "enhance": get_settings('enhance_settings') if enhance else False,
+             "use_text_layer": use_text_layer,
+             "dpi": get_settings('ocr_settings').get('dpi'), "model": TRANSLATION_MODEL,
+             "prompt_version": PROMPT_VERSION},
+            resume=resume
         )
-    except Exception as e:
-        messagebox.showerror("错误", f"PDF转换失败: {str(e)}")
-        logging.error(f"PDF转换失败: {str(e)}")
-        return []
-    image_files = []
-    for i, image in enumerate(images):
-        image_path = os.path.join(output_folder, f"temp_page_{i + 1}.png")
-        image.save(image_path, 'PNG')
-        image.close()
-        image_files.append(image_path)
-    return image_files
-
-def enhance_image(image_path, output_path, enhance_level=1.5):
-    image = Image.open(image_path)
-    enhancer = ImageEnhance.Sharpness(image)
-    enhanced_image = enhancer.enhance(enhance_level)
-    enhanced_image.save(output_path)
+        restored = [n for n in range(1, total_pages + 1) if manifest.reached(n, "ocr_done")]
+        if restored:
+            logging.info(f"从断点恢复：{len(restored)} 页已完成OCR，"
+                         f"{sum(manifest.reached(n, 'translated') for n in restored)} 页已翻译")
+            progress(f"从断点恢复，已完成 {len(restored)} 页", 0)
+
+        ocr_dpi = get_settings('ocr_settings')['dpi']
+
+        # 渲染 → 预处理 → OCR → 翻译 各阶段并行推进：第N页翻译时第N+1页在OCR、第N+2页在渲染
+        def rasterize():
+            # 计时不包含 yield 期间被下游背压阻塞的时间
+            wall, cpu = time.perf_counter(), time.thread_time()
+            for page_number, image in iter_pdf_pages(pdf_path):
+                metrics.add_timing("rasterize", page_number, time.perf_counter() - wall, time.thread_time() - cpu)
+                progress(f"已转换第 {page_number}/{total_pages} 页", None)
+                yield manifest.restore(PageTask(page_number, image))
+                wall, cpu = time.perf_counter(), time.thread_time()
+
+        def prepare_stage(task):
+            image = task.image
+            if enhance:
+                with metrics.stage("enhance", task.number):
+                    if keep_images:
+                        image.save(os.path.join(image_folder, f"temp_page_{task.number}.png"), 'PNG')
+                    image = enhance_image(image)
+                    task.image.close()
+                    task.image = image
+            if keep_images:
+                image.save(os.path.join(image_folder, f"{task.title}.png"), 'PNG')
+            with metrics.stage("encode", task.number):
+                task.image_bytes = encode_embed_image(image, img_width)
+            if not manifest.reached(task.number, "ocr_done") and not usable_text_layer(text_layer.get(task.number)):
+                with metrics.stage("ocr_prepare", task.number):
+                    ocr_image, task.ocr_dpi = prepare_ocr_image(image, ocr_dpi)
+                if ocr_image is not image:
+                    image.close()
+                    task.image = ocr_image
+            return task
+
+        def ocr_stage(task):
+            try:
+                if manifest.reached(task.number, "ocr_done"):
+                    return task
+                embedded_text = usable_text_layer(text_layer.get(task.number))
+                if embedded_text:
+                    task.original_text = embedded_text
+                    task.text_source = "text_layer"
+                    logging.info(f"图片 {task.number}/{total_pages}: 使用嵌入文本层，跳过OCR")
+                    manifest.record(task.number, "ocr_done", original_text=task.original_text, text_source=task.text_source)
+                    return task
+                logging.info(f"图片 {task.number}/{total_pages}: 开始OCR识别")
+                try:
+                    logging.info(f"图片 {task.number}/{total_pages}: OCR分辨率 {task.ocr_dpi} DPI")
+                    # OCR在子进程中运行，这里的CPU时间只包含等待结果的开销
+                    with metrics.stage("ocr", task.number):
+                        _, lines = ocr_pool.recognize(task.number, task.image, dpi=task.ocr_dpi)
+                    task.original_text = "\n".join(line["text"] for line in lines)
+                    task.text_source = "ocr"
+                    manifest.record(task.number, "ocr_done", original_text=task.original_text, text_source=task.text_source)
+                except ConversionError:
+                    # OCR进程池无法恢复，整个转换失败一次，不再逐页报错
+                    raise
+                except Exception as e:
+                    # 单页失败只写日志，转换结束后统一报告；该页不记为完成，下次运行时重新OCR
+                    logging.error(f"图片 {task.number}/{total_pages}: OCR识别失败: {e}")
+                    failed_pages[task.number] = "ocr"
+                return task
+            finally:
+                # 文档只需要编码后的图片，解码后的像素在OCR之后即可释放
+                task.image.close()
+                task.image = None
+
+        def translate_stage(tasks):
+            # 同一批的多个页面一起翻译，短页面会被合并进同一个请求
+            todo = [task for task in tasks
+                    if task.original_text and not manifest.reached(task.number, "translated")]
+            if todo:
+                logging.info(f"开始翻译第 {', '.join(str(task.number) for task in todo)} 页")
+                wall, cpu = time.perf_counter(), time.thread_time()
+                results = translate_pages([task.original_text for task in todo], target_language, metrics=metrics)
+                # 一批页面共用请求，耗时按页均摊
+                wall, cpu = (time.perf_counter() - wall) / len(todo), (time.thread_time() - cpu) / len(todo)
+                for task, (translated_text, failed) in zip(todo, results):
+                    metrics.add_timing("translate", task.number, wall, cpu)
+                    task.translated_text = translated_text
+                    # 有分块翻译失败的页面不记为完成，下次运行时重新翻译
+                    if failed:
+                        failed_pages[task.number] = "translate"
+                    else:
+                        manifest.record(task.number, "translated", translated_text=translated_text)
+            for task in tasks:
+                if task.text_source is not None and not task.original_text and not manifest.reached(task.number, "translated"):
+                    manifest.record(task.number, "translated", translated_text=None)
+            return tasks
+
+        stages = [
+            ("prepare", prepare_stage, settings.get('enhance_workers', 2)),
+            ("ocr", ocr_stage, settings.get('ocr_workers') or ocr_pool.workers),
+            # 翻译阶段线程只负责凑批，请求并发由翻译线程池承担，所以默认只用少量线程
+            ("translate", translate_stage, settings.get('translate_workers') or 2,
+             get_settings('translation_settings').get('batch_pages', 8),
+             get_settings('translation_settings').get('batch_wait', 1.0)),
+        ]
+        pipeline = StagedPipeline(rasterize(), stages, queue_size=settings.get('queue_size', 4), metrics=metrics)
+        progress(f"开始处理 {total_pages} 页...", 0)
+        logging.info(f"共需要处理 {total_pages} 页")
+        volumes = build_document(pipeline.run(), total_pages, img_width, output_file, progress,
+                                 metrics=metrics, volume_pages=volume_pages)
+        if failed_pages:
+            # 保留任务记录以便下次续跑只补做失败的页面
+            status = "partial"
+            progress("处理完成，部分页面失败", 100)
+            raise PartialConversionError(output_file, dict(sorted(failed_pages.items())))
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        progress("处理完成！", 100)
+        status = "ok"
+        return output_file
+    finally:
+        if profiling:
+            metrics.profile.disable()
+        run_report = metrics.report(pdf=pdf_path, output=output_file, volumes=volumes, status=status,
+                                    total_pages=total_pages, failed_pages=sorted(failed_pages))
+        log_run_report(run_report)
+        try:
+            if report:
+                metrics.write(f"{output_file}.report.{report}", run_report)
+            if profiling:
+                metrics.write_profile(f"{output_file}.prof")
+        except OSError as e:
+            logging.error(f"写入运行报告失败: {e}")
+
+_DOCX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Default Extension="jpeg" ContentType="image/jpeg"/>'
+    '<Default Extension="png" ContentType="image/png"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '<Override PartName="/word/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+    '</Types>'
+)
+_DOCX_PACKAGE_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="word/document.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+    '</Relationships>'
+)
+# 页面标题的橙色底纹定义为段落样式，每页只需引用样式名，不必逐段生成底纹XML
+_DOCX_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<w:styles xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+    '<w:docDefaults><w:rPrDefault><w:rPr><w:rFonts w:ascii="Calibri" w:hAnsi="Calibri" w:cs="Calibri"/>'
+    '<w:sz w:val="22"/><w:szCs w:val="22"/></w:rPr></w:rPrDefault>'
+    '<w:pPrDefault><w:pPr><w:spacing w:after="120"/></w:pPr></w:pPrDefault></w:docDefaults>'
+    '<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/><w:qFormat/></w:style>'
+    '<w:style w:type="paragraph" w:customStyle="1" w:styleId="PageTitle"><w:name w:val="Page Title"/>'
+    '<w:basedOn w:val="Normal"/><w:next w:val="Normal"/><w:qFormat/>'
+    '<w:pPr><w:shd w:val="clear" w:color="auto" w:fill="FFC000"/></w:pPr></w:style>'
+    '</w:styles>'
+)
+_DOCX_DOCUMENT_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" '
+    'xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing" '
+    'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+    'xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture"><w:body>'
+)
+# 与python-docx默认模板相同的Letter纸张和页边距
+_DOCX_DOCUMENT_END = (
+    '<w:sectPr><w:pgSz w:w="12240" w:h="15840"/>'
+    '<w:pgMar w:top="1440" w:right="1800" w:bottom="1440" w:left="1800" '
+    'w:header="720" w:footer="720" w:gutter="0"/></w:sectPr></w:body></w:document>'
+)
+_XML_INVALID_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+EMU_PER_INCH = 914400
+
+def _docx_text(text):
+    """转义文本并去掉XML不允许的控制字符；换行和制表符转为 <w:br/> 和 <w:tab/>，与python-docx一致"""
+    text = _XML_INVALID_CHARS.sub('', text)
+    text = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    text = text.replace('\t', '</w:t><w:tab/><w:t xml:space="preserve">')
+    return text.replace('\n', '</w:t><w:br/><w:t xml:space="preserve">')
+
+class DocxWriter:
+    """流式写出.docx文件。
+
+    图片在 add_picture 时立即写入zip（JPEG/PNG本身已压缩，直接存储不再压缩），
+    正文XML先追加到临时文件，close() 时再写成 word/document.xml，因此内存占用
+    与页数无关。文件先写到 <路径>.tmp，完成后才替换为目标文件，失败时不会留下
+    残缺的文档。
+    """
+    def __init__(self, path):
+        import tempfile
+        import zipfile
+        self.path = path
+        self.temp_path = f"{path}.tmp"
+        self.zip = zipfile.ZipFile(self.temp_path, 'w', zipfile.ZIP_DEFLATED)
+        self.body = tempfile.TemporaryFile()
+        self.images = []
+
+    def _write(self, xml):
+        self.body.write(xml.encode('utf-8'))
+
+    def add_paragraph(self, text="", style=None):
+        style_xml = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ''
+        if text:
+            self._write(f'<w:p>{style_xml}<w:r><w:t xml:space="preserve">{_docx_text(text)}</w:t></w:r></w:p>')
+        else:
+            self._write(f'<w:p>{style_xml}</w:p>')
+
+    def add_picture(self, image_bytes, width_inches):
+        """插入一张内嵌图片（JPEG或PNG），高度按原图宽高比计算"""
+        import zipfile
+        from PIL import Image
+        # 只读取图片头部获得尺寸和格式，不解码像素
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            pixel_width, pixel_height = image.size
+            image_format = image.format
+        # 扩展名决定文档中声明的内容类型，只有这两种在 [Content_Types].xml 中有登记
+        extension = {'PNG': 'png', 'JPEG': 'jpeg'}.get(image_format)
+        if extension is None:
+            raise ValueError(f"文档只能嵌入JPEG或PNG图片，收到 {image_format}")
+        number = len(self.images) + 1
+        name = f"image{number}.{extension}"
+        self.zip.writestr(f"word/media/{name}", image_bytes, compress_type=zipfile.ZIP_STORED)
+        self.images.append(name)
+        rel_id = f"rIdImage{number}"
+        cx = int(width_inches * EMU_PER_INCH)
+        cy = int(cx * pixel_height / pixel_width)
+        self._write(
+            f'<w:p><w:r><w:drawing><wp:inline distT="0" distB="0" distL="0" distR="0">'
+            f'<wp:extent cx="{cx}" cy="{cy}"/><wp:docPr id="{number}" name="Picture {number}"/>'
+            f'<wp:cNvGraphicFramePr><a:graphicFrameLocks noChangeAspect="1"/></wp:cNvGraphicFramePr>'
+            f'<a:graphic><a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/picture">'
+            f'<pic:pic><pic:nvPicPr><pic:cNvPr id="{number}" name="{name}"/><pic:cNvPicPr/></pic:nvPicPr>'
+            f'<pic:blipFill><a:blip r:embed="{rel_id}"/><a:stretch><a:fillRect/></a:stretch></pic:blipFill>'
+            f'<pic:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+            f'<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></pic:spPr></pic:pic>'
+            f'</a:graphicData></a:graphic></wp:inline></w:drawing></w:r></w:p>'
+        )
+
+    def close(self):
+        """写出文档主体和其余部件，完成后替换目标文件"""
+        relationships = ''.join(
+            f'<Relationship Id="rIdImage{number}" Target="media/{name}" '
+            f'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"/>'
+            for number, name in enumerate(self.images, 1)
+        )
+        self.zip.writestr('[Content_Types].xml', _DOCX_CONTENT_TYPES)
+        self.zip.writestr('_rels/.rels', _DOCX_PACKAGE_RELS)
+        self.zip.writestr('word/styles.xml', _DOCX_STYLES)
+        self.zip.writestr('word/_rels/document.xml.rels', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rIdStyles" Target="styles.xml" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"/>'
+            f'{relationships}</Relationships>'
+        ))
+        with self.zip.open('word/document.xml', 'w') as document:
+            document.write(_DOCX_DOCUMENT_START.encode('utf-8'))
+            self.body.seek(0)
+            shutil.copyfileobj(self.body, document, 1 << 20)
+            document.write(_DOCX_DOCUMENT_END.encode('utf-8'))
+        self.zip.close()
+        self.body.close()
+        os.replace(self.temp_path, self.path)
+
+    def abort(self):
+        """放弃写入并删除临时文件"""
+        self.zip.close()
+        self.body.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+def volume_path(output_file, volume):
+    """分卷输出时第 volume 卷的文件名：讲义.docx → 讲义_part1.docx"""
+    root, ext = os.path.splitext(output_file)
+    return f"{root}_part{volume}{ext or '.docx'}"
+
+def build_document(tasks, total_pages, img_width, output_file, progress, metrics=None, volume_pages=0):
+    """按页序把流水线产出的页面写入文档，返回写出的文件列表。
+
+    乱序完成的页面暂存在重排缓冲区中，按序到达的页面立即写入。volume_pages 大于0
+    且页数超过它时，每 volume_pages 页写成一卷（见 volume_path）。
+    """
+    stage = metrics.stage if metrics is not None else (lambda name, page=None: nullcontext())
+    split = 0 < volume_pages < total_pages
+    paths = []
+    writer = None
+    pending = {}
+    next_number = 1
+    text_sources = {}
+    try:
+        for task in tasks:
+            pending[task.number] = task
+            while next_number in pending:
+                task = pending.pop(next_number)
+                if writer is None:
+                    paths.append(volume_path(output_file, len(paths) + 1) if split else output_file)
+                    writer = DocxWriter(paths[-1])
+                with stage("docx_insert", task.number):
+                    writer.add_paragraph(task.title, style="PageTitle")
+                    writer.add_picture(task.image_bytes, img_width)
+                    task.image_bytes = None
+                    if task.original_text:
+                        writer.add_paragraph(f"原文: {task.original_text}")
+                        writer.add_paragraph(f"翻译: {task.translated_text or '（翻译失败）'}")
+                    else:
+                        writer.add_paragraph("原文: （无识别内容）")
+                        writer.add_paragraph("翻译: （无识别内容）")
+                    writer.add_paragraph()
+                text_sources[task.text_source] = text_sources.get(task.text_source, 0) + 1
+                progress(f"处理完成 {next_number}/{total_pages}", next_number / total_pages * 95)
+                logging.info(f"图片 {next_number}/{total_pages}: 处理完成")
+                if split and next_number % volume_pages == 0:
+                    with stage("save"):
+                        writer.close()
+                    logging.info(f"第 {len(paths)} 卷已保存到: {paths[-1]}")
+                    writer = None
+                next_number += 1
+        if writer is not None:
+            with stage("save"):
+                writer.close()
+            writer = None
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    logging.info(f"文档已保存到: {', '.join(paths)}")
+    logging.info(f"文本来源：嵌入文本层 {text_sources.get('text_layer', 0)} 页，"
+                 f"OCR {text_sources.get('ocr', 0)} 页，识别失败 {text_sources.get(None, 0)} 页")
+    cache = _translation_cache
+    if cache is not None:
+        stats = cache.stats()
+        logging.info(f"翻译缓存命中 {stats['hits']} 次，未命中 {stats['misses']} 次")
+    cache = _ocr_cache
+    if cache is not None:
+        stats = cache.stats()
+        logging.info(f"OCR缓存命中 {stats['hits']} 次，未命中 {stats['misses']} 次")
+    return paths
 
 class ImageProcessorApp:
     def __init__(self, root):
@@ -321,149 +2407,153 @@ class ImageProcessorApp:
             self.root.after(0, lambda: self.process_button.grid(row=8, column=0, pady=20))
             return
         try:
-            self.update_status("正在转换PDF为图片...", 0)
-            temp_folder = os.path.join(os.path.dirname(file_path), "temp_images")
-            if not os.path.exists(temp_folder):
-                os.makedirs(temp_folder)
-            image_files = pdf_to_images(file_path, temp_folder)
-            if not image_files:
-                return
-            # 计算总步骤数：PDF转换、图片增强、图片重命名、文档创建（每张图片多步骤）、完成状态
-            total_steps = 1
-            if self.enhance_var.get():
-                total_steps += len(image_files)
-            total_steps += len(image_files)
-            total_steps += len(image_files) * 3
-            total_steps += 1
-            step = 1
-            total_images = len(image_files)
-            self.update_status(f"共转换出 {total_images} 张图片", step / total_steps * 100)
-            
-            # 如果需要增强图片，逐张处理并更新进度
-            enhanced_files = []
-            if self.enhance_var.get():
-                enhance_level = 1.5
-                for i, img_path in enumerate(image_files, start=1):
-                    enhanced_path = os.path.join(
-                        temp_folder,
-                        os.path.basename(img_path).replace("temp_page_", "enhanced_page_")
-                    )
-                    enhance_image(img_path, enhanced_path, enhance_level)
-                    enhanced_files.append(enhanced_path)
-                    if not self.keep_var.get():
-                        os.remove(img_path)
-                    step += 1
-                    # 此处更新的进度值按比例计算，可根据实际情况调整
-                    self.update_status(f"增强图片 {i}/{total_images}", 10 + i/total_images*10)
-                image_files = enhanced_files
-
-            renamed_files = self.rename_images(temp_folder, image_files)
-            if not renamed_files:
-                return
-            step += 1
-            self.update_status("开始创建文档...", step / total_steps * 100)
-            self.create_image_document(temp_folder, step, total_steps)
-            step += 1
-            if not self.keep_var.get():
-                shutil.rmtree(temp_folder, ignore_errors=True)
-            self.update_status("处理完成！", step / total_steps * 100)
+            convert_pdf(
+                file_path,
+                target_language=self.language_var.get(),
+                img_width=IMAGE_WIDTHS[self.size_var.get()],
+                enhance=self.enhance_var.get(),
+                keep_images=self.keep_var.get(),
+                progress=self.update_status
+            )
             # 恢复“开始处理”按钮
             self.root.after(0, lambda: self.process_button.grid(row=8, column=0, pady=20))
             messagebox.showinfo("完成", "文档已生成完成！")
+        except PartialConversionError as e:
+            self.root.after(0, lambda: self.process_button.grid(row=8, column=0, pady=20))
+            messagebox.showwarning("部分完成", str(e))
         except Exception as e:
             messagebox.showerror("错误", f"处理过程中出错: {str(e)}")
             logging.error(f"处理过程中出错: {str(e)}")
             self.root.after(0, lambda: self.process_button.grid(row=8, column=0, pady=20))
 
-    def extract_number_from_filename(self, filename):
-        match = re.search(r'_(\d{2})(?:\.|$)', filename)
-        if match:
-            return int(match.group(1))
-        return 9999
+class JsonLogFormatter(logging.Formatter):
+    """每条日志输出为一行JSON，附带通过 extra 传入的全部结构化字段"""
+    # LogRecord自带的属性，其余属性都来自 extra
+    RESERVED = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
 
-    def rename_images(self, directory, image_files):
-        self.update_status("正在重命名图片...", 20)
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "thread": record.threadName,
+            "message": record.getMessage()
+        }
+        for field, value in vars(record).items():
+            if field not in self.RESERVED:
+                entry[field] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def collect_pdfs(inputs):
+    """展开命令行输入，返回 [(PDF路径, 相对子目录)]：文件原样保留（子目录为空），
+    目录递归查找其中的PDF，子目录为该PDF所在目录相对输入目录的路径。
+    同一个PDF被多次指定时只保留一次；不存在的路径由调用方事先检查"""
+    pdfs = []
+    seen = set()
+    for path in inputs:
+        if os.path.isdir(path):
+            found = []
+            for directory, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                found.extend((os.path.join(directory, name), os.path.relpath(directory, path))
+                             for name in sorted(filenames) if name.lower().endswith('.pdf'))
+        else:
+            found = [(path, "")]
+        for pdf_path, subdir in found:
+            key = os.path.normcase(os.path.abspath(pdf_path))
+            if key not in seen:
+                seen.add(key)
+                pdfs.append((pdf_path, "" if subdir == os.curdir else subdir))
+    return pdfs
+
+def run_batch(args):
+    """无界面批量转换，全部成功返回0，有失败（包括部分页面失败）返回1，没有可处理的输入返回2"""
+    handler = logging.StreamHandler(sys.stderr)
+    if args.log_format == "json":
+        handler.setFormatter(JsonLogFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logging.getLogger().addHandler(handler)
+
+    inputs = list(args.inputs)
+    output = args.output
+    # 兼容 `pdfToDoc.py 输入文件.pdf 输出文档.docx` 的写法
+    if output is None and len(inputs) == 2 and inputs[1].lower().endswith('.docx'):
+        output = inputs.pop()
+    missing = [path for path in inputs if not os.path.exists(path)]
+    if missing:
+        logging.error(f"输入不存在: {', '.join(missing)}", extra={"event": "no_input"})
+        return 2
+    pdfs = collect_pdfs(inputs)
+    if not pdfs:
+        logging.error("没有找到要转换的PDF文件", extra={"event": "no_input"})
+        return 2
+    single_output = output is not None and output.lower().endswith('.docx')
+    if single_output and len(pdfs) > 1:
+        logging.error("输出为单个.docx文件时只能输入一个PDF", extra={"event": "bad_output"})
+        return 2
+    # 输出到目录时按输入目录的结构建立子目录，不同子目录中的同名PDF不会互相覆盖
+    outputs = {}
+    for pdf_path, subdir in pdfs:
+        outputs[pdf_path] = output if single_output else default_output_path(
+            pdf_path, os.path.join(output, subdir) if output is not None else None)
+    targets = {}
+    for pdf_path, output_file in outputs.items():
+        targets.setdefault(os.path.normcase(os.path.abspath(output_file)), []).append(pdf_path)
+    conflicts = [paths for paths in targets.values() if len(paths) > 1]
+    if conflicts:
+        # 并行写同一个输出会损坏文档和断点记录，在开始前拒绝
+        for paths in conflicts:
+            logging.error(f"多个输入对应同一个输出文档 {outputs[paths[0]]}: {', '.join(paths)}",
+                          extra={"event": "bad_output", "output": outputs[paths[0]]})
+        return 2
+
+    def convert_one(pdf_path):
+        output_file = outputs[pdf_path]
+        os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+        start = time.time()
+        logging.info(f"开始转换 {pdf_path}", extra={"event": "start", "pdf": pdf_path})
         try:
-            renamed_files = []
-            for index, img_path in enumerate(image_files, 1):
-                new_name = f"幻灯片 {index:02d}{os.path.splitext(img_path)[1]}"
-                new_path = os.path.join(directory, new_name)
-                os.rename(img_path, new_path)
-                renamed_files.append(new_name)
-                self.update_status(f"重命名图片 {index}/{len(image_files)}", 20 + index/len(image_files)*10)
-            return renamed_files
+            convert_pdf(
+                pdf_path,
+                output_file,
+                target_language=args.lang,
+                img_width=args.image_width,
+                enhance=args.enhance,
+                keep_images=args.keep_images,
+                use_text_layer=False if args.force_ocr else None,
+                resume=not args.restart,
+                report=args.report,
+                profile=args.profile or None,
+                volume_pages=args.volume_pages
+            )
+        except PartialConversionError as e:
+            logging.error(f"部分页面失败 {pdf_path}: {str(e)}", extra={
+                "event": "partial", "pdf": pdf_path, "output": output_file, "error": str(e),
+                "failed_pages": sorted(e.failed_pages), "seconds": round(time.time() - start, 3)
+            })
+            return False
         except Exception as e:
-            messagebox.showerror("错误", f"重命名过程中出错: {str(e)}")
-            logging.error(f"重命名过程中出错: {str(e)}")
-            return None
+            logging.error(f"转换失败 {pdf_path}: {str(e)}", extra={
+                "event": "failed", "pdf": pdf_path, "error": str(e),
+                "seconds": round(time.time() - start, 3)
+            })
+            return False
+        logging.info(f"转换完成 {pdf_path}", extra={
+            "event": "done", "pdf": pdf_path, "output": output_file,
+            "seconds": round(time.time() - start, 3)
+        })
+        return True
 
-    def create_image_document(self, input_directory, start_step, total_steps):
-        doc = Document()
-        image_extensions = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
-        img_width = {'1': 4, '2': 6, '3': 8}[self.size_var.get()]
-        def get_slide_number(filename):
-            match = re.search(r'幻灯片 (\d+)', filename)
-            if match:
-                return int(match.group(1))
-            return 9999
-        image_files = [f for f in os.listdir(input_directory) if f.lower().endswith(image_extensions)]
-        image_files.sort(key=get_slide_number)
-        step = start_step
-        total_images = len(image_files)
-        self.update_status(f"开始处理 {total_images} 张图片...", 40)
-        logging.info(f"共需要处理 {total_images} 张图片")
-        
-        for index, filename in enumerate(image_files, 1):
-            image_path = os.path.join(input_directory, filename)
-            try:
-                file_name_without_ext = os.path.splitext(filename)[0]
-                paragraph = doc.add_paragraph(file_name_without_ext)
-                paragraph._p.get_or_add_pPr().append(
-                    parse_xml(f'<w:shd {nsdecls("w")} w:fill="FFC000"/>')
-                )
-                step += 1
-                self.update_status(f"插入文件名 {index}/{total_images}", step / total_steps * 100)
-                doc.add_picture(image_path, width=Inches(img_width))
-                step += 1
-                self.update_status(f"插入图片 {index}/{total_images}", step / total_steps * 100)
-                self.update_status(f"图片 {index}/{total_images}: 正在进行OCR识别...", step / total_steps * 100)
-                logging.info(f"图片 {index}/{total_images}: 开始OCR识别 {filename}")
-                original_text = ocr_text(image_path)
-                step += 1
-                self.update_status(f"OCR识别完成 {index}/{total_images}", step / total_steps * 100)
-                if original_text:
-                    self.update_status(f"图片 {index}/{total_images}: 正在翻译...", step / total_steps * 100)
-                    logging.info(f"图片 {index}/{total_images}: 开始翻译 {filename}")
-                    translated_text = translate_text_in_chunks(original_text, self.language_var.get())
-                    step += 1
-                    self.update_status(f"翻译完成 {index}/{total_images}", step / total_steps * 100)
-                    if translated_text:
-                        doc.add_paragraph(f"原文: {original_text}")
-                        doc.add_paragraph(f"翻译: {translated_text}")
-                    else:
-                        doc.add_paragraph(f"原文: {original_text}")
-                        doc.add_paragraph("翻译: （翻译失败）")
-                else:
-                    doc.add_paragraph("原文: （无识别内容）")
-                    doc.add_paragraph("翻译: （无识别内容）")
-                    step += 1
-                    self.update_status(f"处理无识别内容 {index}/{total_images}", step / total_steps * 100)
-                doc.add_paragraph()
-                step += 1
-                self.update_status(f"处理完成 {index}/{total_images}", step / total_steps * 100)
-                logging.info(f"图片 {index}/{total_images}: 处理完成 {filename}")
-            except Exception as e:
-                messagebox.showerror("错误", f"处理图片 {filename} 时出错: {str(e)}")
-                logging.error(f"处理图片 {filename} 时出错: {str(e)}")
-                return
-        output_file = os.path.join(
-            os.path.dirname(input_directory),
-            f"{os.path.basename(self.pdf_file)}_转换结果.docx"
-        )
-        doc.save(output_file)
-        logging.info(f"文档已保存到: {output_file}")
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs), thread_name_prefix="job") as executor:
+        results = list(executor.map(convert_one, outputs))
+    failed = results.count(False)
+    logging.info(f"批量转换结束：成功 {len(results) - failed} 个，失败 {failed} 个", extra={"event": "summary"})
+    return 1 if failed else 0
 
-def main():
+def run_gui():
+    global tk, filedialog, messagebox, ttk
+    import tkinter as tk
+    from tkinter import filedialog, messagebox, ttk
     root = tk.Tk()
     app = ImageProcessorApp(root)
     if sys.platform == 'darwin':
@@ -471,10 +2561,53 @@ def main():
     try:
         root.mainloop()
     finally:
-        if hasattr(ocr_text, "ocr_engine"):
-            del ocr_text.ocr_engine
         if sys.platform == 'darwin':
             subprocess.run(['purge'], check=True)
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="PDF智能转换器：不带输入文件时打开图形界面，带输入文件时以无界面批量模式运行"
+    )
+    parser.add_argument("inputs", nargs="*", help="要转换的PDF文件或包含PDF的目录")
+    parser.add_argument("-o", "--output", help="输出.docx文件（单个输入时）或输出目录（输入目录中的子目录结构会在其中保留）")
+    parser.add_argument("-l", "--lang", default="ch", help="翻译目标语言（默认 ch）")
+    parser.add_argument("--image-width", type=float, default=6, help="插入图片的宽度，单位英寸（默认 6）")
+    parser.add_argument("--enhance", action="store_true", help="增强图片清晰度")
+    parser.add_argument("--keep-images", action="store_true", help="保留转换出的页面图片")
+    parser.add_argument("--force-ocr", action="store_true", help="忽略PDF的嵌入文本层，所有页面都进行OCR")
+    parser.add_argument("--restart", action="store_true", help="忽略上次中断留下的断点记录，从头转换")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="同时转换的PDF数量（默认 1）")
+    parser.add_argument("--log-format", choices=["text", "json"], default="text", help="标准错误输出的日志格式")
+    parser.add_argument("--config", help="配置文件路径（默认读取环境变量 PDFTODOC_CONFIG 或当前目录的 config.json）")
+    parser.add_argument("--no-ocr-cache", action="store_true", help="本次运行不读写OCR缓存")
+    parser.add_argument("--clear-ocr-cache", action="store_true", help="启动前清空OCR缓存")
+    parser.add_argument("--volume-pages", type=int,
+                        help="每隔多少页分卷输出为 <输出文档>_part1.docx、_part2.docx…（默认不分卷）")
+    parser.add_argument("--report", choices=["json", "csv"],
+                        help="在输出文档旁写出运行报告 <输出文档>.report.json/csv（各阶段耗时、API延迟、缓存命中等）")
+    parser.add_argument("--profile", action="store_true", help="用cProfile剖析转换过程，结果写入 <输出文档>.prof")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging()
+    if args.config:
+        set_config(load_config(args.config))
+    if args.clear_ocr_cache:
+        cache = get_ocr_cache()
+        if cache is not None:
+            cache.clear()
+            logging.info("OCR缓存已清空")
+    if args.no_ocr_cache:
+        get_settings('cache_settings').setdefault('ocr', {})['enabled'] = False
+    try:
+        if args.inputs:
+            return run_batch(args)
+        run_gui()
+        return 0
+    finally:
+        shutdown_ocr_pool()
+        shutdown_async_translation_client()
+
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pdfToDoc
+
+NO_CACHE = {"translation": {"enabled": False}, "ocr": {"enabled": False}}
+
+
+@pytest.fixture(autouse=True)
+def empty_config(tmp_path, monkeypatch):
+    """每个测试使用空配置，所有设置取代码中的默认值，不读取仓库的 config.json。
+
+    缓存默认关闭；自行设置配置而重新打开缓存的测试，缓存数据库也只会写到临时的主目录，
+    不会写入真实的 ~/.pdfToDoc，缓存单例也不会在测试之间共享。
+    """
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    monkeypatch.setattr(pdfToDoc, "_translation_cache", None)
+    monkeypatch.setattr(pdfToDoc, "_ocr_cache", None)
+    pdfToDoc.set_config({"cache_settings": NO_CACHE})
+    yield
+    for cache in (pdfToDoc._translation_cache, pdfToDoc._ocr_cache):
+        if cache is not None:
+            cache.conn.close()
+    pdfToDoc.set_config(None)
@@ -0,0 +1,83 @@
+import json
+import logging
+import os
+
+import pytest
+
+import pdfToDoc
+
+
+@pytest.fixture(autouse=True)
+def restore_log_handlers():
+    # run_batch 会给根日志器加一个输出到stderr的处理器
+    handlers = list(logging.getLogger().handlers)
+    yield
+    logging.getLogger().handlers[:] = handlers
+
+
+def touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b"%PDF-1.4")
+    return str(path)
+
+
+def run(monkeypatch, argv):
+    converted = {}
+
+    def fake_convert(pdf_path, output_file, **kwargs):
+        converted[pdf_path] = output_file
+        return output_file
+
+    monkeypatch.setattr(pdfToDoc, "convert_pdf", fake_convert)
+    return pdfToDoc.run_batch(pdfToDoc.parse_args(argv)), converted
+
+
+def test_collect_pdfs_keeps_subdirectories_and_skips_duplicates(tmp_path):
+    first = touch(tmp_path / "lectures" / "week1" / "slides.pdf")
+    second = touch(tmp_path / "lectures" / "week2" / "slides.pdf")
+    top = touch(tmp_path / "lectures" / "intro.pdf")
+    root = str(tmp_path / "lectures")
+    assert pdfToDoc.collect_pdfs([root, first]) == [
+        (top, ""), (first, "week1"), (second, "week2")]
+
+
+def test_output_directory_mirrors_input_tree(tmp_path, monkeypatch):
+    first = touch(tmp_path / "lectures" / "week1" / "slides.pdf")
+    second = touch(tmp_path / "lectures" / "week2" / "slides.pdf")
+    out = tmp_path / "out"
+    code, converted = run(monkeypatch, [str(tmp_path / "lectures"), "-o", str(out), "-j", "2"])
+    assert code == 0
+    assert converted == {
+        first: pdfToDoc.default_output_path(first, str(out / "week1")),
+        second: pdfToDoc.default_output_path(second, str(out / "week2")),
+    }
+    assert (out / "week1").is_dir() and (out / "week2").is_dir()
+
+
+def test_conflicting_outputs_are_rejected_before_converting(tmp_path, monkeypatch):
+    first = touch(tmp_path / "a" / "slides.pdf")
+    second = touch(tmp_path / "b" / "slides.pdf")
+    code, converted = run(monkeypatch, [first, second, "-o", str(tmp_path / "out")])
+    assert code == 2 and converted == {}
+
+
+def test_missing_input_exits_with_no_input(tmp_path, monkeypatch):
+    existing = touch(tmp_path / "a.pdf")
+    code, converted = run(monkeypatch, [existing, str(tmp_path / "typo.pdf")])
+    assert code == 2 and converted == {}
+
+
+def test_json_log_keeps_failed_pages_of_partial_conversion(tmp_path, monkeypatch, capsys):
+    pdf = touch(tmp_path / "a.pdf")
+
+    def partial_convert(pdf_path, output_file, **kwargs):
+        raise pdfToDoc.PartialConversionError(output_file, {5: "translate", 2: "ocr"})
+
+    monkeypatch.setattr(pdfToDoc, "convert_pdf", partial_convert)
+    code = pdfToDoc.run_batch(pdfToDoc.parse_args([pdf, "--log-format", "json"]))
+    assert code == 1
+    events = [json.loads(line) for line in capsys.readouterr().err.splitlines()]
+    partial = next(entry for entry in events if entry.get("event") == "partial")
+    assert partial["failed_pages"] == [2, 5]
+    assert partial["pdf"] == pdf and "seconds" in partial
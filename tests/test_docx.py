@@ -0,0 +1,94 @@
+import io
+import zipfile
+
+import pytest
+from PIL import Image
+
+import pdfToDoc
+
+
+def image_bytes(fmt, size=(40, 20)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("fmt, expected", [("JPEG", "JPEG"), ("jpg", "JPEG"), ("png", "PNG")])
+def test_encode_embed_image_accepts_word_formats(fmt, expected):
+    pdfToDoc.set_config({"embed_settings": {"format": fmt, "dpi": 10}})
+    data = pdfToDoc.encode_embed_image(Image.new('RGB', (200, 100), 'white'), 4)
+    with Image.open(io.BytesIO(data)) as image:
+        assert image.format == expected
+        assert image.size == (40, 20)
+
+
+@pytest.mark.parametrize("fmt", ["WEBP", "GIF", "bmp"])
+def test_encode_embed_image_rejects_other_formats(fmt):
+    pdfToDoc.set_config({"embed_settings": {"format": fmt}})
+    with pytest.raises(pdfToDoc.ConversionError, match="JPEG 或 PNG"):
+        pdfToDoc.encode_embed_image(Image.new('RGB', (20, 10), 'white'), 4)
+
+
+def test_add_picture_names_media_by_detected_format(tmp_path):
+    writer = pdfToDoc.DocxWriter(str(tmp_path / "out.docx"))
+    writer.add_picture(image_bytes('PNG'), 4)
+    writer.add_picture(image_bytes('JPEG'), 4)
+    with pytest.raises(ValueError):
+        writer.add_picture(image_bytes('GIF'), 4)
+    writer.close()
+    with zipfile.ZipFile(tmp_path / "out.docx") as docx:
+        assert sorted(name for name in docx.namelist() if name.startswith("word/media/")) == [
+            "word/media/image1.png", "word/media/image2.jpeg"]
+
+
+def test_docx_writer_output_opens_in_python_docx(tmp_path):
+    docx = pytest.importorskip("docx")
+    path = tmp_path / "out.docx"
+    writer = pdfToDoc.DocxWriter(str(path))
+    writer.add_paragraph("幻灯片 01", style="PageTitle")
+    writer.add_picture(image_bytes('JPEG', (300, 150)), 4)
+    writer.add_paragraph("原文: a < b & c\x0b")
+    writer.close()
+    assert not (tmp_path / "out.docx.tmp").exists()
+    document = docx.Document(str(path))
+    assert [p.text for p in document.paragraphs if p.text] == ["幻灯片 01", "原文: a < b & c"]
+    shape = document.inline_shapes[0]
+    assert shape.width == 4 * pdfToDoc.EMU_PER_INCH
+    assert shape.height == 2 * pdfToDoc.EMU_PER_INCH
+
+
+def test_docx_writer_abort_leaves_no_files(tmp_path):
+    writer = pdfToDoc.DocxWriter(str(tmp_path / "out.docx"))
+    writer.add_paragraph("x")
+    writer.abort()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_build_document_splits_volumes_in_page_order(tmp_path):
+    tasks = []
+    for number in (2, 1, 3, 5, 4):
+        task = pdfToDoc.PageTask(number, None)
+        task.image_bytes = image_bytes('PNG')
+        task.original_text, task.translated_text, task.text_source = f"p{number}", f"译{number}", "ocr"
+        tasks.append(task)
+    output = str(tmp_path / "book.docx")
+    paths = pdfToDoc.build_document(iter(tasks), 5, 4, output, lambda *args: None, volume_pages=2)
+    assert paths == [pdfToDoc.volume_path(output, n) for n in (1, 2, 3)]
+    with zipfile.ZipFile(paths[0]) as docx:
+        body = docx.read("word/document.xml").decode("utf-8")
+    assert body.index("原文: p1") < body.index("原文: p2") and "p3" not in body
+
+
+def test_cache_statistics_do_not_create_cache_databases(tmp_path, monkeypatch):
+    # 缓存默认开启：只读统计不应在主目录下创建 ~/.pdfToDoc/*.sqlite3
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    monkeypatch.setattr(pdfToDoc, "_translation_cache", None)
+    monkeypatch.setattr(pdfToDoc, "_ocr_cache", None)
+    pdfToDoc.set_config({})
+    task = pdfToDoc.PageTask(1, None)
+    task.image_bytes = image_bytes('PNG')
+    task.original_text, task.translated_text, task.text_source = "p1", "译1", "text_layer"
+    pdfToDoc.RunMetrics()
+    pdfToDoc.build_document(iter([task]), 1, 4, str(tmp_path / "out.docx"), lambda *args: None)
+    assert not (tmp_path / "home").exists()
+    assert pdfToDoc._translation_cache is None and pdfToDoc._ocr_cache is None
@@ -0,0 +1,97 @@
+import numpy as np
+from PIL import Image, ImageDraw
+
+import pdfToDoc
+
+
+def text_page(width=800, height=1000, line_height=24, gap=24):
+    """白底黑字的合成页面：每行是一条实心墨迹带"""
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    y = 60
+    while y + line_height < height - 60:
+        draw.rectangle((60, y, width - 60, y + line_height - 1), fill=(20, 20, 20))
+        y += line_height + gap
+    return image
+
+
+def test_luminance_extremes_do_not_overflow():
+    white = np.full((4, 4, 3), 255, dtype=np.uint8)
+    black = np.zeros((4, 4, 3), dtype=np.uint8)
+    assert pdfToDoc.luminance(white).dtype == np.uint8
+    assert (pdfToDoc.luminance(white) == 255).all()
+    assert (pdfToDoc.luminance(black) == 0).all()
+
+
+def test_luminance_matches_float_weights():
+    rng = np.random.default_rng(0)
+    array = rng.integers(0, 256, (32, 32, 3), dtype=np.uint8)
+    expected = array.astype(np.float64) @ np.array([0.299, 0.587, 0.114])
+    assert np.abs(pdfToDoc.luminance(array).astype(np.float64) - expected).max() <= 2
+
+
+def test_luminance_passes_grayscale_through():
+    gray = np.arange(256, dtype=np.uint8).reshape(16, 16)
+    assert pdfToDoc.luminance(gray) is gray
+
+
+def test_binarize_keeps_white_background():
+    page = np.asarray(text_page())
+    result = pdfToDoc.enhance_array(page, binarize=True)
+    assert result.ndim == 2
+    assert result[10, 10] == 255
+    assert result[70, 400] == 0
+
+
+def test_sharpen_keeps_flat_regions_unchanged():
+    page = np.full((64, 64, 3), 200, dtype=np.uint8)
+    result = pdfToDoc.enhance_array(page, sharpen=1.0, contrast=False)
+    assert (result == 200).all()
+
+
+def test_enhance_image_returns_same_size_rgb():
+    image = text_page(200, 300)
+    result = pdfToDoc.enhance_image(image)
+    assert result.size == image.size
+    assert result.getpixel((5, 5)) == (255, 255, 255)
+
+
+def test_estimate_line_height_on_text_page():
+    height = pdfToDoc.estimate_line_height(text_page(line_height=24))
+    assert height is not None
+    assert abs(height - 24) <= 1
+
+
+def test_estimate_line_height_blank_page():
+    assert pdfToDoc.estimate_line_height(Image.new('RGB', (400, 500), 'white')) is None
+
+
+def test_prepare_ocr_image_scales_by_line_height():
+    # 48像素行高 → 缩到 target_line_px=28，约 300*28/48=175 DPI，高于 min_dpi
+    image, dpi = pdfToDoc.prepare_ocr_image(text_page(line_height=48, gap=48), 300)
+    assert dpi == 175
+    assert image.width == round(800 * 28 / 48)
+
+
+def sparse_noisy_page(seed=0):
+    """只有一小段文字（约0.5%墨迹）的标题页，纸张底色245并带σ=4的噪声"""
+    rng = np.random.default_rng(seed)
+    page = np.clip(rng.normal(245, 4, (1200, 1600)), 0, 255).astype(np.uint8)
+    page[580:620, 600:840] = 30
+    return np.repeat(page[..., None], 3, axis=2)
+
+
+def test_contrast_stretch_leaves_sparse_noisy_page_alone():
+    page = sparse_noisy_page()
+    background = (slice(0, 500), slice(0, 1600))
+    result = pdfToDoc.enhance_array(page, sharpen=0, contrast=True)
+    gray = pdfToDoc.luminance(result)[background]
+    assert gray.std() < 6
+    assert (gray < 128).mean() < 0.001
+
+
+def test_contrast_stretch_still_applies_to_faded_page():
+    page = np.full((400, 400), 180, dtype=np.uint8)
+    page[100:300, 100:300] = 90
+    result = pdfToDoc.enhance_array(page, sharpen=0, contrast=True)
+    assert result[10, 10] == 255 and result[200, 200] == 0
@@ -0,0 +1,60 @@
+import pdfToDoc
+
+
+def make_manifest(tmp_path, resume=True, options=None):
+    pdf = tmp_path / "doc.pdf"
+    if not pdf.exists():
+        pdf.write_bytes(b"%PDF-1.4 test")
+    return pdfToDoc.JobManifest(str(tmp_path / "doc.docx.job.jsonl"), str(pdf),
+                                options or {"lang": "ch"}, resume=resume)
+
+
+def test_manifest_replays_recorded_pages(tmp_path):
+    manifest = make_manifest(tmp_path)
+    manifest.record(1, "ocr_done", original_text="hello", text_source="ocr")
+    manifest.record(1, "translated", translated_text="你好")
+    manifest.record(2, "ocr_done", original_text="world", text_source="pdf")
+
+    reloaded = make_manifest(tmp_path)
+    assert reloaded.reached(1, "translated")
+    assert reloaded.reached(2, "ocr_done")
+    assert not reloaded.reached(2, "translated")
+    task = reloaded.restore(pdfToDoc.PageTask(1, None))
+    assert (task.original_text, task.translated_text) == ("hello", "你好")
+
+
+def test_manifest_recovers_after_torn_last_line(tmp_path):
+    manifest = make_manifest(tmp_path)
+    manifest.record(1, "translated", translated_text="一")
+    with open(manifest.path, 'a', encoding='utf-8') as f:
+        f.write('{"type": "page", "page": 2, "state": "transl')
+
+    resumed = make_manifest(tmp_path)
+    assert resumed.reached(1, "translated")
+    assert resumed.state(2) is None
+    resumed.record(2, "translated", translated_text="二")
+    resumed.record(3, "ocr_done", original_text="three")
+
+    reloaded = make_manifest(tmp_path)
+    assert reloaded.reached(1, "translated")
+    assert reloaded.reached(2, "translated")
+    assert reloaded.reached(3, "ocr_done")
+
+
+def test_manifest_ignores_complete_json_without_newline(tmp_path):
+    manifest = make_manifest(tmp_path)
+    manifest.record(1, "ocr_done", original_text="one")
+    with open(manifest.path, 'a', encoding='utf-8') as f:
+        f.write('{"type": "page", "page": 1, "state": "translated"}')
+
+    resumed = make_manifest(tmp_path)
+    assert resumed.state(1) == "ocr_done"
+    resumed.record(1, "translated", translated_text="一")
+    assert make_manifest(tmp_path).reached(1, "translated")
+
+
+def test_manifest_restarts_when_options_change(tmp_path):
+    make_manifest(tmp_path).record(1, "translated", translated_text="一")
+    changed = make_manifest(tmp_path, options={"lang": "en"})
+    assert changed.pages == {}
+    assert make_manifest(tmp_path, options={"lang": "en"}).pages == {}
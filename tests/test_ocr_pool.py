@@ -0,0 +1,63 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+from PIL import Image
+
+import pdfToDoc
+
+
+class CrashingEngine:
+    """第一次识别时杀掉所在的工作进程（模拟内存不足被系统杀掉），之后正常返回"""
+    def __init__(self, marker, always):
+        self.marker = marker
+        self.always = always
+
+    def ocr(self, image, cls=False):
+        if self.always or not os.path.exists(self.marker):
+            open(self.marker, 'w').close()
+            os._exit(1)
+        return [[[[[0, 0], [1, 0], [1, 1], [0, 1]], ("hello", 0.9)]]]
+
+
+def _init_crashing_worker(marker, always):
+    pdfToDoc._worker_ocr_engine = CrashingEngine(marker, always)
+
+
+class CrashingPool(pdfToDoc.OCRWorkerPool):
+    def __init__(self, marker, always=False):
+        self.marker = marker
+        self.always = always
+        super().__init__(workers=1, threads_per_worker=1)
+
+    def _create_executor(self):
+        return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_crashing_worker, initargs=(self.marker, self.always))
+
+
+@pytest.fixture(autouse=True)
+def no_ocr_cache():
+    pdfToDoc.set_config({"cache_settings": {"ocr": {"enabled": False}}})
+
+
+def test_pool_is_rebuilt_after_worker_dies(tmp_path):
+    pool = CrashingPool(str(tmp_path / "crashed"))
+    try:
+        first = pool.executor
+        index, lines = pool.recognize(3, Image.new('RGB', (20, 20), 'white'))
+        assert pool.executor is not first
+        assert index == 3 and lines[0]["text"] == "hello"
+        # 重建后的进程池继续可用
+        assert pool.recognize(4, Image.new('RGB', (20, 20), 'white'))[0] == 4
+    finally:
+        pool.shutdown()
+
+
+def test_repeated_crash_fails_conversion_once(tmp_path):
+    pool = CrashingPool(str(tmp_path / "crashed"), always=True)
+    try:
+        with pytest.raises(pdfToDoc.ConversionError, match="反复崩溃"):
+            pool.recognize(1, Image.new('RGB', (20, 20), 'white'))
+    finally:
+        pool.shutdown()
@@ -0,0 +1,200 @@
+import pytest
+
+import pdfToDoc
+
+
+@pytest.fixture
+def api_config(monkeypatch):
+    pdfToDoc.set_config({
+        "api_config": {"endpoint": "http://127.0.0.1:9/v1/chat/completions", "key": "test"},
+        "translation_settings": {"max_retries": 3, "backoff_base": 0, "request_deadline": 30,
+                                 "breaker_failures": 2, "breaker_reset": 60},
+        "cache_settings": {"translation": {"enabled": False}},
+    })
+    monkeypatch.setattr(pdfToDoc, "_circuit_breaker", None)
+    return pdfToDoc.get_config()
+
+
+def complete_stream(text):
+    parser = pdfToDoc.SSEParser()
+    parser.feed(f'data: {{"choices":[{{"delta":{{"content":"{text}"}}}}]}}\n\ndata: [DONE]\n\n'.encode())
+    return parser
+
+
+def attempt(attempts, status, text="译文", retry_after=None):
+    """模拟传输层完成一次尝试，返回尝试前的动作"""
+    action, value = attempts.next_action()
+    while action == "wait":
+        action, value = attempts.next_action()
+    if action == "done":
+        return action
+    attempts.sending()
+    attempts.responded(status, retry_after)
+    if status == 200:
+        attempts.parser = complete_stream(text)
+    attempts.completed()
+    return action
+
+
+def test_breaker_opens_after_threshold_and_probes_once():
+    breaker = pdfToDoc.CircuitBreaker(failure_threshold=2, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow() is True
+    breaker.record_failure()
+    assert breaker.allow() == "probe"
+    assert breaker.allow() is False
+    assert breaker.retry_in() == breaker.PROBE_POLL
+    breaker.release()
+    assert breaker.allow() == "probe"
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_rate_limited_responses_do_not_open_breaker_or_use_retries(api_config):
+    with pdfToDoc.TranslationAttempts("hello", "ch") as attempts:
+        for _ in range(10):
+            attempt(attempts, 429, retry_after=0)
+        attempt(attempts, 200)
+    assert attempts.result.ok and attempts.result.text == "译文"
+    assert attempts.result.attempts == 11
+    assert pdfToDoc.get_circuit_breaker().state == "closed"
+
+
+def test_client_errors_fail_without_opening_breaker(api_config):
+    for _ in range(3):
+        with pdfToDoc.TranslationAttempts("hello", "ch") as attempts:
+            attempt(attempts, 400)
+        assert attempts.result.status == 400 and attempts.result.attempts == 1
+    assert pdfToDoc.get_circuit_breaker().failures == 0
+
+
+def test_server_errors_retry_then_open_breaker(api_config):
+    with pdfToDoc.TranslationAttempts("hello", "ch") as attempts:
+        for _ in range(3):
+            attempt(attempts, 503)
+    # 第2次失败后熔断，冷却时间超过请求时限，不再等待第3次尝试
+    assert attempts.result.error == "翻译请求失败，状态码：503"
+    assert attempts.result.attempts == 2
+    assert pdfToDoc.get_circuit_breaker().state == "open"
+
+
+def test_open_breaker_waits_for_cool_down_within_deadline(api_config):
+    breaker = pdfToDoc.get_circuit_breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.reset_timeout = 5
+    attempts = pdfToDoc.TranslationAttempts("hello", "ch")
+    action, wait = attempts.next_action()
+    assert action == "wait" and 0 < wait <= 5
+    breaker.reset_timeout = 120
+    action, result = attempts.next_action()
+    assert action == "done" and "熔断" in result.error
+
+
+def test_probe_is_released_when_attempt_is_abandoned(api_config):
+    breaker = pdfToDoc.get_circuit_breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.reset_timeout = 0
+    with pytest.raises(KeyboardInterrupt):
+        with pdfToDoc.TranslationAttempts("hello", "ch") as attempts:
+            assert attempts.next_action()[0] == "send"
+            assert breaker.probing
+            raise KeyboardInterrupt
+    assert not breaker.probing
+    assert breaker.allow() == "probe"
+
+
+def test_rate_limited_probe_releases_breaker(api_config):
+    breaker = pdfToDoc.get_circuit_breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.reset_timeout = 0
+    with pdfToDoc.TranslationAttempts("hello", "ch") as attempts:
+        attempt(attempts, 429, retry_after=0)
+        assert not breaker.probing
+        attempt(attempts, 200)
+    assert attempts.result.ok
+    assert breaker.state == "closed"
+
+
+def sse_stream(parts, finish_reason="stop", done=True):
+    events = [{"choices": [{"delta": {"content": part}}]} for part in parts]
+    events.append({"choices": [{"delta": {}, "finish_reason": finish_reason}],
+                   "usage": {"prompt_tokens": 5, "completion_tokens": 7}})
+    body = ": keep-alive\n\n" + "".join(f"data: {pdfToDoc.json.dumps(e, ensure_ascii=False)}\n\n" for e in events)
+    if done:
+        body += "data: [DONE]\n\n"
+    return body.encode()
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 10000])
+def test_sse_parser_handles_arbitrary_chunk_boundaries(size):
+    parts = [f"片段{i} " for i in range(20)]
+    stream = sse_stream(parts)
+    parser = pdfToDoc.SSEParser()
+    for start in range(0, len(stream), size):
+        parser.feed(stream[start:start + size])
+    parser.close()
+    assert parser.text == "".join(parts)
+    assert parser.complete
+    assert parser.usage == {"prompt_tokens": 5, "completion_tokens": 7}
+
+
+def test_sse_parser_detects_cut_and_length_limited_streams():
+    stream = sse_stream(["a", "b", "c"])
+    cut = pdfToDoc.SSEParser()
+    cut.feed(stream[:len(stream) // 2])
+    cut.close()
+    assert not cut.complete
+
+    limited = pdfToDoc.SSEParser()
+    limited.feed(sse_stream(["a"], finish_reason="length", done=False))
+    limited.close()
+    assert limited.finish_reason == "length" and not limited.complete
+
+
+def test_sse_parser_accepts_last_line_without_newline():
+    parser = pdfToDoc.SSEParser()
+    parser.feed(b'data: {"choices":[{"delta":{"content":"x"},"finish_reason":"stop"}]}')
+    parser.close()
+    assert parser.text == "x" and parser.complete
+
+
+def test_split_text_into_chunks_respects_budget_and_keeps_text():
+    text = "这是一个句子。" * 200 + "x" * 3000
+    chunks = pdfToDoc.split_text_into_chunks(text, max_tokens=100)
+    assert len(chunks) > 1
+    assert all(pdfToDoc.estimate_tokens(chunk) <= 100 for chunk in chunks)
+    assert "".join(chunks) == text
+
+
+def test_split_text_into_chunks_keeps_short_text_whole():
+    assert pdfToDoc.split_text_into_chunks("Hello world.", max_tokens=100) == ["Hello world."]
+    assert pdfToDoc.split_text_into_chunks("", max_tokens=100) == []
+
+
+def test_pack_segments_fills_requests_in_order():
+    assert pdfToDoc.pack_segments([40, 40, 40, 150, 10], 100) == [[0, 1], [2], [3], [4]]
+    assert pdfToDoc.pack_segments([], 100) == []
+
+
+def test_split_batch_returns_segments_by_marker():
+    result = pdfToDoc.TranslationResult(text="<<<2>>>\n二\n<<<1>>>\n一\n", status=200, attempts=1)
+    assert [part.text for part in pdfToDoc._split_batch(result, 2)] == ["一", "二"]
+
+
+def test_split_batch_rejects_missing_or_empty_segments():
+    assert pdfToDoc._split_batch(pdfToDoc.TranslationResult(text="<<<1>>>\n一"), 2) is None
+    assert pdfToDoc._split_batch(pdfToDoc.TranslationResult(text="<<<1>>>\n一\n<<<2>>>\n"), 2) is None
+
+
+def test_batch_requests_falls_back_to_single_segments():
+    steps = pdfToDoc._batch_requests(["a", "b"], "ch")
+    (text, instruction), = next(steps)
+    assert text == "<<<1>>>\na\n<<<2>>>\nb" and "<<<编号>>>" in instruction
+    fallback = steps.send([pdfToDoc.TranslationResult(text="没有标记的译文")])
+    assert fallback == [("a", None), ("b", None)]
+    with pytest.raises(StopIteration) as done:
+        steps.send([pdfToDoc.TranslationResult(text="甲"), pdfToDoc.TranslationResult(text="乙")])
+    assert [result.text for result in done.value.value] == ["甲", "乙"]